@@ -0,0 +1,271 @@
+"""Benchmark the dashboard against synthetic catalogs and compare with a baseline.
+
+    python bench.py                          # scales 1x and 10x, test client only
+    python bench.py --scales 1,10,100 --gunicorn
+    python bench.py --update-baseline        # record the results as the new baseline
+
+Each scale builds a catalog of `main.csv` repeated N times (phone names
+suffixed so every row is a distinct phone) and measures it in a fresh process
+with an empty artifact cache: import, import + dataset load, the first (cold) and
+warm (median) requests of every route and response sizes. A second
+process then measures a warm start from the cached snapshot and artifacts.
+With --gunicorn, a local gunicorn serving the same catalog is load-tested for
+per-route throughput too.
+
+Results are compared with bench_baseline.json: any metric more than
+--threshold (default 25%; --cold-threshold, 50%, for single-shot cold
+timings) worse than its baseline fails the run (exit code 1), and so does
+any metric the baseline has no entry for (a new scale, route or --gunicorn):
+record it with --update-baseline first.
+Timings are machine-dependent, so record the baseline on the machine that
+runs the comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "bench_baseline.json")
+ROUTES = [
+    "/",
+    "/browse.html",
+    "/browse-full.html",
+    "/browse.json",
+    "/browse.json?limit=25&sort=-price(USD)",
+    "/data/charts.json",
+    "/data/charts.json?summary=1",
+    "/data/charts.json?brand=Samsung&year_min=2020",
+    "/data/insights.json",
+]
+# Single-shot cold measurements (one per process) are noisier than the medians
+# and throughputs, so they get their own, looser threshold (--cold-threshold).
+COLD_METRICS = (" first_ms", "import_s", "startup_s", "ready_s")
+# Differences below these are noise, whatever the relative change.
+ABSOLUTE_SLACK = {"_ms": 2.0, "_s": 0.05, " bytes": 64, " rps": 5.0}
+
+
+def build_catalog(scale, path):
+    """Write main.csv repeated `scale` times, one copy (of raw text) at a time."""
+    with open(os.path.join(HERE, "main.csv")) as f:
+        header, *rows = f.read().splitlines()
+    with open(path, "w") as out:
+        out.write(header + "\n")
+        for copy in range(scale):
+            suffix = "" if copy == 0 else " #%d" % copy
+            # phone_name is the first column; none of them contain commas or quotes.
+            out.write("".join(name + suffix + "," + rest + "\n"
+                              for name, rest in (row.split(",", 1) for row in rows)))
+
+
+def _env(csv, artifacts):
+    return {**os.environ, "PHONE_CSV": csv, "ARTIFACT_DIR": artifacts,
+            "INGEST_LOG": os.path.join(artifacts, "ingested.jsonl")}
+
+
+def measure_in_process(repeat):
+    """Run inside a fresh interpreter (see --worker); prints one JSON object."""
+    started = time.perf_counter()
+    sys.path.insert(0, HERE)
+    import main
+    result = {"import_s": time.perf_counter() - started}
+    main.load()
+    result.update(rows=len(main.current().frame), startup_s=time.perf_counter() - started)
+    # Wait out the cold insights request, so its first_ms is the training run
+    # rather than the 503 a live request would get after INSIGHTS_WAIT_SECONDS.
+    main.INSIGHTS_WAIT_SECONDS = 24 * 3600
+    client = main.app.test_client()
+
+    def get(route):
+        response = client.get(route)
+        assert response.status_code == 200, "%s answered %d" % (route, response.status_code)
+        return response.data
+
+    for route in ROUTES:
+        t = time.perf_counter()
+        body = get(route)
+        result[route + " first_ms"] = (time.perf_counter() - t) * 1000
+        result[route + " bytes"] = len(body)
+        times = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            get(route)
+            times.append(time.perf_counter() - t)
+        result[route + " warm_ms"] = statistics.median(times) * 1000
+    print(json.dumps(result))
+
+
+def _run_worker(env, repeat):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker",
+                          "--repeat", str(repeat)],
+                         env=env, cwd=HERE, capture_output=True, text=True)
+    if out.returncode:
+        sys.exit("FAIL: benchmark worker exited with %d:\n%s" % (out.returncode, out.stderr))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def measure_gunicorn(env, seconds, concurrency, workers):
+    port = _free_port()
+    base = "http://127.0.0.1:%d" % port
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "main:app", "--bind",
+                             "127.0.0.1:%d" % port, "--workers", str(workers)],
+                            env=env, cwd=HERE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    result = {}
+    try:
+        while True:
+            if proc.poll() is not None:
+                sys.exit("FAIL: gunicorn exited before serving (exit code %s)" % proc.returncode)
+            try:
+                urllib.request.urlopen(base + "/", timeout=1).read()
+                break
+            except OSError:
+                time.sleep(0.1)
+        result["gunicorn ready_s"] = time.perf_counter() - started
+
+        def hammer(route):
+            done, deadline = 0, time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                try:
+                    with urllib.request.urlopen(base + route, timeout=60) as response:
+                        response.read()
+                        status = response.status
+                except urllib.error.HTTPError as e:
+                    status = e.code
+                assert status == 200, "%s answered %d" % (route, status)
+                done += 1
+            return done
+
+        for route in ROUTES:
+            with ThreadPoolExecutor(concurrency) as pool:
+                t = time.perf_counter()
+                done = sum(pool.map(hammer, [route] * concurrency))
+                result["gunicorn " + route + " rps"] = done / (time.perf_counter() - t)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return result
+
+
+def run_scale(scale, args):
+    with tempfile.TemporaryDirectory(prefix="bench-%dx-" % scale) as tmp:
+        csv = os.path.join(tmp, "catalog.csv")
+        t = time.perf_counter()
+        build_catalog(scale, csv)
+        print("  %dx catalog written in %.1fs" % (scale, time.perf_counter() - t), file=sys.stderr)
+        env = _env(csv, os.path.join(tmp, "artifacts"))
+        result = _run_worker(env, args.repeat)
+        warm = _run_worker(env, args.repeat)
+        result["warm start import_s"] = warm["import_s"]
+        result["warm start startup_s"] = warm["startup_s"]
+        result["warm start /data/insights.json first_ms"] = warm["/data/insights.json first_ms"]
+        if args.gunicorn:
+            result.update(measure_gunicorn(env, args.seconds, args.concurrency, args.workers))
+    return result
+
+
+def _slack(metric):
+    return next((v for suffix, v in ABSOLUTE_SLACK.items() if metric.endswith(suffix)), 0)
+
+
+def compare(results, baseline, threshold, cold_threshold):
+    """Yield (scale, metric, baseline, current, regressed) for every measured metric.
+
+    `baseline` is None for a metric the baseline does not have.
+    """
+    for scale, metrics in results.items():
+        for metric, current in metrics.items():
+            if metric == "rows":
+                continue
+            base = baseline.get(scale, {}).get(metric)
+            if base is None:
+                yield scale, metric, None, current, False
+                continue
+            limit = cold_threshold if metric.endswith(COLD_METRICS) else threshold
+            if metric.endswith(" rps"):  # higher is better
+                regressed = current < base * (1 - limit) - _slack(metric)
+            else:
+                regressed = current > base * (1 + limit) + _slack(metric)
+            yield scale, metric, base, current, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="1,10", help="comma-separated catalog multipliers")
+    parser.add_argument("--repeat", type=int, default=20, help="warm requests per route")
+    parser.add_argument("--gunicorn", action="store_true", help="also load-test gunicorn")
+    parser.add_argument("--seconds", type=float, default=3.0, help="gunicorn load per route")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--cold-threshold", type=float, default=0.5)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return measure_in_process(args.repeat)
+
+    results = {}
+    for scale in (int(s) for s in args.scales.split(",")):
+        print("benchmarking %dx ..." % scale, file=sys.stderr)
+        results["%dx" % scale] = {k: round(v, 3) for k, v in run_scale(scale, args).items()}
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except OSError:
+        baseline = {}
+
+    failures, unbaselined = [], []
+    checks = compare(results, baseline, args.threshold, args.cold_threshold)
+    for scale, metric, base, current, regressed in checks:
+        if base is None:
+            print("%-5s %-58s %12s -> %12.3f UNBASELINED" % (scale, metric, "-", current))
+            unbaselined.append((scale, metric))
+            continue
+        flag = "REGRESSED" if regressed else ""
+        print("%-5s %-58s %12.3f -> %12.3f %s" % (scale, metric, base, current, flag))
+        if regressed:
+            failures.append((scale, metric))
+
+    if args.update_baseline:
+        baseline.update(results)
+        baseline["_meta"] = {"python": platform.python_version(), "machine": platform.machine(),
+                             "cpus": os.cpu_count(), "recorded": time.strftime("%Y-%m-%d")}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("baseline updated: %s" % args.baseline)
+    elif failures:
+        sys.exit("FAIL: %d metric(s) regressed beyond the threshold: %s" % (
+            len(failures), ", ".join("%s %s" % f for f in failures)))
+    elif unbaselined:
+        sys.exit("FAIL: %d metric(s) have no baseline (record them with --update-baseline): %s" % (
+            len(unbaselined), ", ".join("%s %s" % f for f in unbaselined)))
+    else:
+        print("OK: no regressions beyond %d%% (%d%% for cold measurements)" % (
+            args.threshold * 100, args.cold_threshold * 100))
+
+
+if __name__ == "__main__":
+    main()
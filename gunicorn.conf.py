@@ -0,0 +1,47 @@
+"""Gunicorn settings (picked up automatically from the working directory).
+
+Preload/shared mode (the default; set PRELOAD=0 to disable): the master imports
+main.py, loads the dataset (numeric columns memory-mapped from the snapshot),
+trains or loads the models and renders every cached response once, then forks.
+Workers inherit all of it copy-on-write, so adding a worker adds neither heap
+for another dataset copy nor another training run.
+
+Fast-boot mode (PRELOAD=0): workers import main.py, which loads no data and
+neither pandas nor sklearn, so they listen (and /healthz answers) within a
+fraction of a second, then warm in a background thread. Data routes wait for
+the dataset to load; a cold insights request gets a 503 with Retry-After until
+the models are ready. Each worker builds its own caches (the mapped snapshot
+pages are still shared), so this trades memory for boot time.
+
+The startup report (seconds per boot phase) is served at /healthz; preload
+mode also logs it once warm.
+
+Workers are threaded (THREADS per worker, default 4): while one thread builds a
+cold payload, which concurrent requests for the same payload wait on instead
+of rebuilding, the others keep answering cheap routes.
+"""
+import gc
+import os
+
+preload_app = os.environ.get('PRELOAD', '1') != '0'
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', '4'))
+
+
+def on_starting(server):
+    if not preload_app:
+        return
+    import main
+    main.warm()
+    server.log.info('startup report: %s', main.startup_report())
+    # Move everything built so far into the permanent generation: the workers'
+    # cyclic GC then never writes to those objects' headers, which would
+    # otherwise dirty (and privately copy) the shared pages.
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    if preload_app:
+        return
+    import main
+    main.warm_in_background()
@@ -1,336 +1,2158 @@
+import time
+
+# Start of the import, for the startup report (see /healthz).
+_import_started = time.perf_counter()
+
+import base64
+import bisect
+import collections
+import contextlib
+import datetime
+import fcntl
 import functools
+import gzip
+import hashlib
+import hmac
+import importlib.util
+import json
+import logging
 import os
-import pandas as pd
-from flask import Flask, jsonify, render_template
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import click
+from flask import (Blueprint, Flask, Response, current_app, g, has_request_context, jsonify,
+                   render_template, request, stream_with_context, url_for)
 import io
 
-app = Flask(__name__)
 
-# Load and preprocess data once at startup
-df = pd.read_csv("main.csv")
+def _lazy_import(name):
+    """Module `name`, actually imported on its first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# pandas alone takes longer to import than the rest of the app; nothing at
+# import time needs it, so it loads with the dataset (see load()).
+pd = _lazy_import('pandas')
+
+# Routes, hooks and CLI commands live on this blueprint; create_app() (at the
+# end of the module) registers it on an app. `main:app` is the default instance.
+bp = Blueprint('dashboard', __name__, cli_group=None)
+log = logging.getLogger(__name__)
+
+DATA_CSV = os.environ.get('PHONE_CSV', 'main.csv')
+# The CSV is parsed and preprocessed this many rows at a time, and the chart
+# cells are summed over row chunks of the same size, so transient memory is
+# bounded by the chunk rather than the catalog.
+CSV_CHUNK_ROWS = int(os.environ.get('CSV_CHUNK_ROWS', '100000'))
+
+# Video capability flags. In memory they are packed into one `video_flags`
+# bitmask (bit i = VIDEO_COLS[i]); hidden from the partial browse view.
+VIDEO_COLS = ['video_720p', 'video_1080p', 'video_4K', 'video_8K',
+              'video_30fps', 'video_60fps', 'video_120fps', 'video_240fps',
+              'video_480fps', 'video_960fps']
+
+# Preprocessing and model parameters. Together with the CSV bytes they form the
+# artifact cache key, so changing any of them invalidates cached model outputs.
+PREPROCESS_PARAMS = {
+    'weight_max': 450,
+    'price_max': 1500,
+    'category_cols': ['brand', 'os', 'battery_type'],
+    'corrections': [
+        # Realme GT5 240W listed as 1GB storage but actually 1024GB
+        {'brand': 'Realme', 'phone_name': 'GT5 240W', 'column': 'storage(GB)', 'value': 1024},
+    ],
+}
+MODEL_PARAMS = {
+    'feature_cols': ['inches', 'battery', 'ram(GB)', 'weight(g)', 'storage(GB)',
+                     'width', 'height', 'announcement_year'],
+    'cluster_cols': ['price(USD)', 'battery', 'ram(GB)', 'storage(GB)', 'inches', 'weight(g)'],
+    'test_size': 0.2,
+    'random_state': 42,
+    'rf_estimators': 100,
+    'cv_folds': 5,
+    'kmeans_clusters': 3,
+    'kmeans_n_init': 10,
+}
+
+# On-disk cache for expensive, dataset-derived artifacts (the preprocessed
+# dataset snapshot and the trained insights payload). Each dataset version gets
+# its own subdirectory, so a new CSV or a parameter change simply misses and
+# recomputes; stale versions are never read.
+ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR', '.artifacts')
+# Bump when an artifact's shape changes so older files are not served.
+ARTIFACT_FORMAT = 6
+
+
+def _dataset_key():
+    """Hash of the CSV bytes plus everything that shapes the derived payloads."""
+    import importlib.metadata
+    h = hashlib.sha256()
+    with open(DATA_CSV, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    h.update(json.dumps({
+        'format': ARTIFACT_FORMAT,
+        'preprocess': PREPROCESS_PARAMS,
+        'model': MODEL_PARAMS,
+        # A different sklearn can train a different model from the same inputs.
+        'sklearn': importlib.metadata.version('scikit-learn'),
+    }, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def _artifact_path(name, key=None):
+    return os.path.join(ARTIFACT_DIR, key or current().version, name)
+
+
+def _read_artifact(name, key=None):
+    """Return a cached JSON artifact for a dataset version (default: current), or None."""
+    try:
+        with open(_artifact_path(name, key)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_artifact(name, obj, key=None):
+    """Atomically write a JSON artifact; concurrent writers just race to replace."""
+    path = _artifact_path(name, key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(obj, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        # A read-only filesystem must not take the endpoint down: serve from memory.
+        log.warning('could not write artifact %s: %s', path, e)
+
+
+# --- Instrumentation --------------------------------------------------------------
+# Counters and histograms, kept per process and exposed in Prometheus text
+# format at /metrics. Every request is timed per route, as are the named stages
+# inside it (rendering, compression, chart building, training...) via _stage();
+# a request's stages also go back to the browser in its Server-Timing header.
+METRIC_PREFIX = 'phone_dashboard_'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+_METRICS = {  # name -> (type, help, histogram buckets)
+    'http_request_duration_seconds': ('histogram', 'Request latency by route.', LATENCY_BUCKETS),
+    'http_response_bytes': ('histogram', 'Response body size by route.', BYTES_BUCKETS),
+    'stage_duration_seconds': ('histogram', 'Time spent in named stages.', LATENCY_BUCKETS),
+    'cache_requests_total': ('counter', 'Memoized payload lookups by cache and result.', None),
+    'slow_requests_total': ('counter', 'Requests slower than PROFILE_SLOW_MS.', None),
+    'coalesced_requests_total': ('counter', 'Requests that waited on an in-flight build.', None),
+    'training_failures_total': ('counter', 'Insights training runs that raised.', None),
+}
+_metrics_lock = threading.Lock()
+_counters = collections.defaultdict(float)  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [per-bucket counts (last is +Inf), sum, count]
+
+
+def _count(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        _counters[key] += amount
+
+
+def _observe(name, value, **labels):
+    buckets = _METRICS[name][2]
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        hist[0][bisect.bisect_left(buckets, value)] += 1
+        hist[1] += value
+        hist[2] += 1
+
+
+@contextlib.contextmanager
+def _stage(name):
+    """Time a block as stage `name` (and in the request's Server-Timing, if any)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        _observe('stage_duration_seconds', seconds, stage=name)
+        if has_request_context():
+            g.setdefault('stages', []).append((name, seconds))
+
+
+def _label_text(labels):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{%s}' % ','.join('%s="%s"' % (k, escape(v)) for k, v in labels) if labels else ''
+
+
+def metrics_text():
+    """Every metric in the Prometheus text exposition format."""
+    with _metrics_lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, (list(v[0]), v[1], v[2])) for k, v in _histograms.items())
+    lines = []
+    for name, (kind, help_text, buckets) in _METRICS.items():
+        full = METRIC_PREFIX + name
+        lines += ['# HELP %s %s' % (full, help_text), '# TYPE %s %s' % (full, kind)]
+        if kind == 'counter':
+            lines += ['%s%s %r' % (full, _label_text(labels), value)
+                      for (n, labels), value in counters if n == name]
+            continue
+        for (n, labels), (counts, total, count) in histograms:
+            if n != name:
+                continue
+            cumulative = 0
+            for le, c in zip([repr(float(b)) for b in buckets] + ['+Inf'], counts):
+                cumulative += c
+                lines.append('%s_bucket%s %d' % (full, _label_text(labels + (('le', le),)), cumulative))
+            lines.append('%s_sum%s %r' % (full, _label_text(labels), total))
+            lines.append('%s_count%s %d' % (full, _label_text(labels), count))
+    return '\n'.join(lines) + '\n'
+
+
+# Optional sampling profiler for slow requests: with PROFILE_SLOW_MS > 0 a
+# daemon thread samples the stack of every in-flight request thread each
+# PROFILE_INTERVAL_MS. When a request overruns the threshold its hottest
+# stacks (root;...;leaf, flame-graph style) are logged and the last few kept
+# for /debug/slow.json; faster requests just drop their samples.
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+_profiled = {}  # request thread id -> Counter of sampled stacks
+_slow_requests = collections.deque(maxlen=20)
+_sampler = None
+
+
+def _stack_key(frame, depth=24):
+    stack = []
+    while frame is not None and len(stack) < depth:
+        code = frame.f_code
+        stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                     frame.f_lineno))
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def _sample_forever():
+    while True:
+        time.sleep(PROFILE_INTERVAL_MS / 1000)
+        frames = sys._current_frames()
+        for ident, samples in list(_profiled.items()):
+            frame = frames.get(ident)
+            if frame is not None:
+                samples[_stack_key(frame)] += 1
+
+
+def _start_sampler():
+    global _sampler
+    if _sampler is None or not _sampler.is_alive():
+        _sampler = threading.Thread(target=_sample_forever, name='slow-request-sampler',
+                                    daemon=True)
+        _sampler.start()
+
+
+@bp.before_app_request
+def _start_request_timer():
+    g.started = time.perf_counter()
+    if PROFILE_SLOW_MS > 0:
+        _start_sampler()
+        _profiled[threading.get_ident()] = collections.Counter()
+
+
+@bp.after_app_request
+def _record_request(response):
+    seconds = time.perf_counter() - g.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    _observe('http_request_duration_seconds', seconds, route=route,
+             method=request.method, status=str(response.status_code))
+    if response.content_length is not None:  # streamed bodies have no size yet
+        _observe('http_response_bytes', response.content_length, route=route)
+    timings = g.get('stages', []) + [('total', seconds)]
+    response.headers['Server-Timing'] = ', '.join(
+        '%s;dur=%.2f' % (name, s * 1000) for name, s in timings)
+
+    samples = _profiled.pop(threading.get_ident(), None)
+    if samples is not None and seconds * 1000 >= PROFILE_SLOW_MS:
+        _count('slow_requests_total', route=route)
+        top = samples.most_common(5)
+        _slow_requests.append({
+            'route': route, 'path': request.full_path.rstrip('?'), 'ms': round(seconds * 1000, 1),
+            'samples': sum(samples.values()),
+            'stacks': [{'stack': stack, 'samples': n} for stack, n in top],
+        })
+        log.warning('slow request %s took %.0f ms; hottest stack: %s',
+                    request.full_path.rstrip('?'), seconds * 1000, top[0][0] if top else 'none')
+    return response
+
+
+@bp.teardown_app_request
+def _drop_profile(exc):
+    # After an unhandled error after_request never ran; don't keep sampling.
+    _profiled.pop(threading.get_ident(), None)
+
 
 # DATA PREPROCESSING
-def preprocess_data():
-    global df
-    
-    # Split resolution column into separate Width and Height columns
-    df['width'] = df['resolution'].apply(lambda x: x.split('x')[0]).astype('int64')
-    df['height'] = df['resolution'].apply(lambda x: x.split('x')[1]).astype('int64')
-    
-    # Extract announcement_year from announcement_date column
-    df['announcement_year'] = df['announcement_date'].apply(lambda x: x.split('-')[0]).astype('int32')
-    
-    # Drop announcement_date and resolution columns
-    df.drop(columns=['announcement_date', 'resolution'], inplace=True)
-    
-    # Remove Outliers
+# One vectorized pass: parse resolution/date columns, apply the known-value
+# corrections, then drop outliers with a single combined mask.
+def preprocess_data(raw):
+    """Return the analysis frame for a raw CSV frame (the input is not modified)."""
+    p = PREPROCESS_PARAMS
+
+    # Split resolution ("WxH") into numeric width and height
+    resolution = raw['resolution'].str.split('x', n=1, expand=True)
+
+    # Derive the frame: drop the parsed columns, append width/height/year
+    frame = raw.drop(columns=['announcement_date', 'resolution']).assign(
+        width=resolution[0].astype('int64'),
+        height=resolution[1].astype('int64'),
+        announcement_year=pd.to_datetime(raw['announcement_date'], format='%Y-%m-%d')
+                            .dt.year.astype('int32'),
+    )
+
+    # Known data-entry errors, matched by phone identity rather than row position
+    for fix in p['corrections']:
+        hit = (frame['brand'] == fix['brand']) & (frame['phone_name'] == fix['phone_name'])
+        frame.loc[hit, fix['column']] = fix['value']
+
+    # Remove outliers (NaNs are kept, matching a plain "> limit" drop)
+    outliers = (frame['weight(g)'] > p['weight_max']) | (frame['price(USD)'] > p['price_max'])
+    frame = frame.loc[~outliers].reset_index(drop=True)
+
+    # Low-cardinality strings as categoricals (after filtering, so no unused levels)
+    frame = frame.astype({col: 'category' for col in p['category_cols']})
+    return compact_frame(frame)
+
+
+def read_preprocessed(path, chunksize=None):
+    """preprocess_data() of the CSV at `path`, parsed one chunk of rows at a time.
+
+    Returns (frame, chart cells). Preprocessing is row-local, so chunks are
+    preprocessed independently and their compact frames stitched together
+    exactly as a one-shot read would have produced them. Each chunk's chart
+    cells are summed as it is read, so the finished frame is never rescanned.
+    """
+    from pandas.api.types import union_categoricals
+    pieces, cells = [], None
+    with _stage('preprocess'):
+        for raw in pd.read_csv(path, chunksize=chunksize or CSV_CHUNK_ROWS):
+            chunk = preprocess_data(raw)
+            del raw
+            measures = _cell_measures(chunk)
+            cells = measures if cells is None else cells.add(measures, fill_value=0)
+            del measures
+            # Kept as separately owned columns (not views into the chunk's
+            # blocks), so each is freed as soon as it is stitched below.
+            pieces.append({col: chunk[col].copy() for col in chunk.columns})
+            del chunk  # before the next chunk is parsed
+    # Stitch column by column, dropping the chunks' parts as they are used:
+    # the finished frame is the only full-size object.
+    category_cols = PREPROCESS_PARAMS['category_cols']
+    data = {}
+    for col in list(pieces[0]):
+        parts = [p.pop(col) for p in pieces]
+        data[col] = (union_categoricals(parts, sort_categories=True) if col in category_cols
+                     else pd.concat(parts, ignore_index=True))
+        del parts
+    # Chunks can infer different dtypes (e.g. NaNs in only one of them); settle
+    # on what the whole column allows.
+    return _downcast(pd.DataFrame(data, copy=False)), cells
+
+
+# --- Compact in-memory model --------------------------------------------------
+# Every worker holds its own df, so it is stored compactly: categoricals for
+# low-cardinality strings (above), the ten video_* booleans packed into one
+# uint16 `video_flags` column, and numerics downcast where that is lossless.
+# Code that exposes rows (browse pages, /browse.json) unpacks the flags with
+# with_video_columns(), so the public schema is unchanged.
+def compact_frame(frame):
+    import numpy as np
+    weights = (1 << np.arange(len(VIDEO_COLS))).astype(np.uint16)
+    flags = frame[VIDEO_COLS].to_numpy(dtype=np.uint16) @ weights
+    at = frame.columns.get_loc(VIDEO_COLS[0])
+    frame = frame.drop(columns=VIDEO_COLS)
+    frame.insert(at, 'video_flags', flags.astype(np.uint16))
+    return _downcast(frame)
+
+
+def _downcast(frame):
+    for col in frame.columns:
+        s = frame[col]
+        if pd.api.types.is_integer_dtype(s.dtype) and col != 'video_flags':
+            frame[col] = pd.to_numeric(s, downcast='integer')
+        elif pd.api.types.is_float_dtype(s.dtype):
+            # Only when every value survives the round trip; prices and screen
+            # sizes like 6.74 would otherwise print as 6.7399997.
+            small = s.astype('float32')
+            if small.astype(s.dtype).equals(s):
+                frame[col] = small
+    return frame
+
+
+def video_flag(frame, col):
+    """Boolean array for one video_* capability, decoded from the bitmask."""
+    bit = VIDEO_COLS.index(col)
+    return (frame['video_flags'].to_numpy() >> bit & 1).astype(bool)
+
+
+def with_video_columns(frame):
+    """`frame` with `video_flags` unpacked back into the boolean video_* columns."""
+    at = frame.columns.get_loc('video_flags')
+    videos = pd.DataFrame({col: video_flag(frame, col) for col in VIDEO_COLS},
+                          index=frame.index)
+    return pd.concat([frame.iloc[:, :at], videos, frame.iloc[:, at + 1:]], axis=1)
+
+
+def public_dtypes(frame):
+    """with_video_columns(frame) in the public dtypes, as preprocess_data() first
+    builds them: str for categoricals, 64-bit numbers for downcast ones."""
+    frame = with_video_columns(frame)
+    dtypes = {}
+    for col, dtype in frame.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtypes[col] = 'str'
+        elif col == 'announcement_year':
+            dtypes[col] = 'int32'
+        elif pd.api.types.is_integer_dtype(dtype):
+            dtypes[col] = 'int64'
+        elif pd.api.types.is_float_dtype(dtype):
+            dtypes[col] = 'float64'
+    return frame.astype(dtypes)
+
+
+def public_columns():
+    """Column names as exposed to clients (video flags unpacked)."""
+    cols = list(current().frame.columns)
+    at = cols.index('video_flags')
+    return cols[:at] + VIDEO_COLS + cols[at + 1:]
+
+
+def _is_mapped(values):
+    """True if a numpy array's buffer is a (shared) file mapping, not private heap."""
+    import numpy as np
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = getattr(values, 'base', None)
+    return False
+
+
+def memory_report():
+    """Per-column bytes of df (heap vs file-mapped), plus the process's peak RSS."""
+    import resource
+    df = current().frame
+    usage = df.memory_usage(deep=True, index=True)
+    columns = []
+    for col, nbytes in usage.items():
+        if col not in df:
+            mapped = False
+        elif isinstance(df[col].dtype, pd.CategoricalDtype):
+            mapped = _is_mapped(df[col].array.codes)
+        else:
+            mapped = _is_mapped(df[col].to_numpy())
+        columns.append({'column': str(col),
+                        'dtype': str(df[col].dtype) if col in df else 'index',
+                        'bytes': int(nbytes), 'mapped': mapped})
+    return {
+        'rows': len(df),
+        'columns': columns,
+        'total_bytes': int(usage.sum()),
+        'heap_bytes': sum(c['bytes'] for c in columns if not c['mapped']),
+        # ru_maxrss is KiB on Linux
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+# --- Preprocessed snapshot ------------------------------------------------------
+# The preprocessed frame is stored per dataset version as one .npy file per
+# column (category codes + levels for categoricals, fixed-width unicode for
+# strings) plus a small JSON manifest, so later starts skip CSV parsing and
+# preprocessing and get back exactly the same dtypes.
+def _save_snapshot(frame, path):
+    import numpy as np
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(path), prefix='.snapshot-')
+    columns = []
+    for i, col in enumerate(frame.columns):
+        s = frame[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            values, entry = s.cat.codes.to_numpy(), {'kind': 'category',
+                                                    'categories': s.cat.categories.tolist()}
+        elif pd.api.types.is_string_dtype(s.dtype):
+            values, entry = s.to_numpy(dtype=str), {'kind': 'str'}
+        else:
+            values, entry = s.to_numpy(), {'kind': 'numpy'}
+        np.save(os.path.join(tmp, '%d.npy' % i), values, allow_pickle=False)
+        columns.append(dict(entry, name=col))
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump({'rows': len(frame), 'columns': columns}, f)
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # Another process published the same snapshot first; keep theirs.
+        import shutil
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _load_snapshot(path, mmap=True):
+    """Load a snapshot; numeric columns stay memory-mapped from the .npy files.
+
+    Mapped pages live in the OS page cache, so every worker process that loads
+    the same snapshot shares one physical copy instead of holding its own.
+    """
+    import numpy as np
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    data = {}
+    for i, entry in enumerate(manifest['columns']):
+        values = np.load(os.path.join(path, '%d.npy' % i), allow_pickle=False,
+                         mmap_mode='r' if mmap else None)
+        if entry['kind'] == 'category':
+            data[entry['name']] = pd.Categorical.from_codes(values, entry['categories'])
+        elif entry['kind'] == 'str':
+            data[entry['name']] = pd.array(values.astype(object), dtype='str')
+        else:
+            data[entry['name']] = values
+    # copy=False keeps each numeric column backed by its read-only mapping
+    return pd.DataFrame(data, copy=False)
+
+
+def load_dataset(version):
+    """(frame, chart cells) for dataset `version`, from snapshot when possible.
+
+    The cells come for free when the CSV is read; from a snapshot they are
+    None (see _accumulate_cells).
+    """
+    path = _artifact_path('dataset', version)
+    try:
+        with _stage('load-snapshot'):
+            return _load_snapshot(path), None
+    except (OSError, ValueError, KeyError):
+        pass
+    frame, cells = read_preprocessed(DATA_CSV)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _save_snapshot(frame, path)
+        # Reload so this process, too, serves from the shared mapping
+        return _load_snapshot(path), cells
+    except (OSError, ValueError) as e:
+        log.warning('could not write dataset snapshot %s: %s', path, e)
+    return frame, cells
+
+
+# --- Deferred dataset loading ---------------------------------------------------
+# Importing main loads no data: load() hashes the CSV, maps the snapshot (or
+# preprocesses the CSV), sums the chart cells and applies the ingest log, once
+# per process, on the first request that needs data, from warm() or from a CLI
+# command. /healthz and /metrics never call it, so a fresh process answers
+# health checks as soon as the interpreter is up. Each phase's duration is kept
+# for the startup report.
+#
+# The loaded data is published as one immutable Dataset snapshot: the version,
+# the frame and its chart cells, swapped together by a single reference
+# assignment (load(), _apply_batch). A request reads it once, via current(),
+# and memoized builders take the snapshot as an argument, so their cache keys
+# carry the version they were built from and a build that outlives an ingest
+# can never be served as the new version.
+class Dataset(collections.namedtuple('Dataset', 'version frame cells')):
+    """One dataset version; hashes and compares by `version` alone."""
+    __slots__ = ()
+
+    def __hash__(self):
+        return hash(self.version)
+
+    def __eq__(self, other):
+        return isinstance(other, Dataset) and self.version == other.version
+
+    def __ne__(self, other):
+        return not self == other
 
-    # Remove weight > 450
-    Outliers_W = df[df['weight(g)'] > 450]
-    df.drop(Outliers_W.index, inplace=True, axis=0)
-    df.reset_index(drop=True, inplace=True)
-    
-    # Correct Storage
-    # Realme GT5 240W listed as 1GB storage but actually 1024GB
-    if len(df) > 1507:  # Safety check
-        df.iloc[1507, 8] = 1024
-    
-    # Remove price > 1500
-    Outliers_P = df[df['price(USD)'] > 1500]
-    df.drop(Outliers_P.index, inplace=True, axis=0)
-    df.reset_index(drop=True, inplace=True)
 
-# Preprocess data at startup
-preprocess_data()
+_dataset = None
+_load_lock = threading.Lock()
+_startup = {}  # phase -> seconds, in the order they ran
+
+
+@contextlib.contextmanager
+def _startup_phase(name):
+    started = time.perf_counter()
+    with _stage('startup-' + name):
+        yield
+    _startup[name] = round(time.perf_counter() - started, 4)
+
+
+def load():
+    """Load the current dataset version into this process (a no-op once loaded)."""
+    global _dataset
+    if _dataset is not None:
+        return
+    with _load_lock:
+        if _dataset is not None:
+            return
+        with _startup_phase('dataset-key'):
+            version = _dataset_key()
+        with _startup_phase('dataset'):
+            frame, cells = load_dataset(version)
+        with _startup_phase('chart-cells'):
+            if cells is None:
+                cells = _accumulate_cells(frame)
+        _dataset = Dataset(version, frame, cells)
+        with _startup_phase('ingest-log'):
+            # Apply anything already logged before this process started.
+            _sync_ingest_log()
+
+
+def current():
+    """The Dataset this request works on (the latest one outside a request).
+
+    Read once per request (see _sync_before_request), so every part of one
+    response comes from the same version even if an ingest lands meanwhile.
+    """
+    if has_request_context():
+        if 'dataset' not in g:
+            load()
+            g.dataset = _dataset
+        return g.dataset
+    load()
+    return _dataset
+
+
+def startup_report():
+    """Seconds spent in each startup phase so far, plus the process uptime."""
+    return {'phases': dict(_startup), 'dataset_loaded': _dataset is not None,
+            'uptime_seconds': round(time.perf_counter() - _import_started, 3)}
+
+# --- Serialized response cache -------------------------------------------------
+# Pages and JSON payloads are pure functions of df, so each is rendered once per
+# dataset version and kept as ready-to-send bytes in every encoding we offer.
+# Repeat visits revalidate with If-None-Match and get a bodiless 304. Keeping
+# finished bytes (rather than dicts to re-serialize) is also what makes the
+# preload mode cheap: a handful of large bytes objects built in the gunicorn
+# master are shared copy-on-write by every worker (see warm()).
+try:
+    import brotli
+except ImportError:  # optional: without it responses are offered as gzip/identity only
+    brotli = None
+
+_response_cache = {}
+_response_cache_lock = threading.Lock()  # writers only; reads are single get()s
+
+
+def _encode_variants(body):
+    """Precompress `body` once; returns {encoding: (bytes, strong etag)}."""
+    tag = hashlib.sha256(body).hexdigest()[:20]
+    variants = {'identity': (body, tag),
+                'gzip': (gzip.compress(body, compresslevel=9, mtime=0), tag + '-gz')}
+    if brotli is not None:
+        variants['br'] = (brotli.compress(body, quality=11), tag + '-br')
+    return variants
+
+
+# Single flight: after a deploy, a burst of first visitors (one per gunicorn
+# thread) would otherwise each build the same cold payload. The first caller
+# for a key builds it; concurrent callers wait for that result instead.
+_inflight = {}  # key -> Future of the build in progress
+_inflight_lock = threading.Lock()
+
+
+def _coalesced(key, build):
+    """build(), run once for all concurrent callers with the same `key`."""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+    if not owner:
+        _count('coalesced_requests_total', build=str(key[0]))
+        return future.result()
+    try:
+        result = build()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def _cached_response(name, render, mimetype='text/html', version=None):
+    """Serve `name`, rendering it with `render()` on first use per version.
+
+    `version` defaults to the dataset version; pass the version the body was
+    actually built from when that can lag behind (the insights payload).
+    """
+    key = (name, version or current().version)
+    variants = _response_cache.get(key)
+    _count('cache_requests_total', cache='response:' + name,
+           result='miss' if variants is None else 'hit')
+    if variants is None:
+        variants = _coalesced(key, lambda: _render_to_cache(key, render))
+    return _send_variant(variants, mimetype)
+
+
+def _render_to_cache(key, render):
+    name = key[0]
+    with _stage('render-' + name):
+        body = render()
+    with _stage('compress'):
+        variants = _encode_variants(body.encode('utf-8') if isinstance(body, str) else body)
+    # Drop renders of older dataset versions before caching the new one. Under
+    # the lock: other threads insert keys while this one scans the dict.
+    with _response_cache_lock:
+        for stale in [k for k in _response_cache if k[0] == name]:
+            del _response_cache[stale]
+        _response_cache[key] = variants
+    return variants
+
+
+def _send_variant(variants, mimetype):
+    accepted = request.accept_encodings
+    encoding = next((e for e in ('br', 'gzip') if e in variants and accepted[e]), 'identity')
+    body, tag = variants[encoding]
+    if request.if_none_match.contains(tag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype=mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(tag)
+    response.vary.add('Accept-Encoding')
+    # Always revalidate: the ETag makes that a cheap 304 until the data changes.
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 
 # Home Page (using template)
-@app.route("/")
+@bp.route("/")
 def home():
-    
-    # Capture df.info()
+    return _cached_response('home', _render_home)
+
+
+def _render_home():
+    # Capture df.info() (public schema: video flags unpacked, public dtypes)
+    public = public_dtypes(current().frame)
     buffer = io.StringIO()
-    df.info(buf=buffer)
+    public.info(buf=buffer)
     info_output = buffer.getvalue()
     buffer.close()
     
     # df.describe() output to html with fixed precision
-    descr_output = df.describe().to_html(float_format=lambda x: f"{x:.2f}")
+    descr_output = public.describe().to_html(float_format=lambda x: f"{x:.2f}")
     
     return render_template('index.html', 
         dataframe_info=info_output,
         dataframe_describe=descr_output)
 
+# Above this many rows the browse pages stop embedding the whole table and let
+# DataTables page through /browse.json server-side instead.
+BROWSE_SERVER_SIDE_ROWS = int(os.environ.get('BROWSE_SERVER_SIDE_ROWS', '5000'))
+
 # Browse CSV as an html table
-@app.route('/browse.html')
+@bp.route('/browse.html')
 def browse():
-    # Pandas Display Options
-    pd.set_option('display.float_format', '{}'.format)
-    
-    # Define columns to exclude
-    exclude = [
-        'video_720p', 'video_1080p', 'video_4K', 'video_8K',
-        'video_30fps', 'video_60fps', 'video_120fps', 'video_240fps',
-        'video_480fps', 'video_960fps'
-    ]
-    
-    # Create a copy of the dataframe excluding specified columns
-    df_filtered = df.drop(columns=[col for col in exclude if col in df.columns])
-    
-    # Convert filtered csv to html
-    table_html = df_filtered.to_html(classes='data', header="true", index=False)
+    return _cached_response('browse', _render_browse)
+
+
+def _render_browse():
+    df = current().frame
+    columns = [c for c in df.columns if c != 'video_flags']
+    if len(df) > BROWSE_SERVER_SIDE_ROWS:
+        return render_template('browse.html', columns=columns)
+
+    # Convert filtered csv to html; print floats as-is rather than pandas' 6 digits
+    with _stage('to_html'):
+        table_html = df[columns].to_html(classes='data', header="true", index=False,
+                                         float_format='{}'.format)
     
     # Return using template
     return render_template('browse.html',
         table_html=table_html)
 
 # Browse CSV as an html table
-@app.route('/browse-full.html')
+@bp.route('/browse-full.html')
 def browsefull():
-    # Pandas Display Options
-    pd.set_option('display.float_format', '{}'.format)
-    
+    return _cached_response('browse-full', _render_browse_full)
+
+
+def _render_browse_full():
+    df = current().frame
+    if len(df) > BROWSE_SERVER_SIDE_ROWS:
+        return render_template('browse-full.html', columns=public_columns())
+
     # Convert csv to html
-    table_html = df.to_html(classes='data', header="true", index=False)
+    with _stage('to_html'):
+        table_html = with_video_columns(df).to_html(classes='data', header="true", index=False,
+                                float_format='{}'.format)
     
     # Return using template
     return render_template('browse-full.html',
         table_html=table_html)
 
-@app.route('/browse.json')
+
+# --- /browse.json paging -----------------------------------------------------
+# Without query parameters /browse.json returns every record (the download
+# link). With paging parameters it answers from precomputed sort orders and a
+# per-brand/per-OS position index, so an unfiltered page costs O(limit) and a
+# filtered one a few vectorized passes, never a per-request sort or to_dict of
+# the whole frame. Plain API:
+#   ?offset=0&limit=25&sort=-price(USD)&q=galaxy&brand=Samsung&os=...&price_min=&price_max=
+# DataTables' server-side protocol (draw/start/length/search[value]/order[..])
+# is detected by the `draw` parameter.
+BROWSE_PAGE_DEFAULT = 25
+BROWSE_PAGE_MAX = 1000
+_BROWSE_PARAMS = {'offset', 'limit', 'sort', 'q', 'brand', 'os', 'price_min', 'price_max'}
+
+
+@functools.cache
+def _sort_order(ds, col):
+    """Row positions of ds.frame sorted ascending by `col` (stable), built on first use."""
+    import numpy as np
+    df = ds.frame
+    values = video_flag(df, col) if col in VIDEO_COLS else df[col].to_numpy()
+    return np.argsort(values, kind='stable')
+
+
+@functools.cache
+def _position_index(ds, col):
+    """Mapping value -> array of row positions, for equality filters."""
+    return ds.frame.groupby(col, sort=False).indices
+
+
+@functools.cache
+def _search_text(ds):
+    """Lower-cased name/brand/OS per row, the haystack for the `q` filter."""
+    df = ds.frame
+    text = df['phone_name'].astype(str) + ' ' + df['brand'].astype(str) + ' ' + df['os'].astype(str)
+    return text.str.lower()
+
+
+def _browse_query(ds, offset=0, limit=BROWSE_PAGE_DEFAULT, sort=None, descending=False,
+                  q=None, brands=(), oses=(), price_min=None, price_max=None):
+    """Return (filtered_count, page_positions) for a browse query."""
+    import numpy as np
+
+    n = len(ds.frame)
+    mask = None
+    for col, wanted in (('brand', brands), ('os', oses)):
+        if wanted:
+            index = _position_index(ds, col)
+            m = np.zeros(n, dtype=bool)
+            for value in wanted:
+                m[index.get(value, [])] = True
+            mask = m if mask is None else mask & m
+    if price_min is not None or price_max is not None:
+        price = ds.frame['price(USD)'].to_numpy()
+        m = np.ones(n, dtype=bool)
+        if price_min is not None:
+            m &= price >= price_min
+        if price_max is not None:
+            m &= price <= price_max
+        mask = m if mask is None else mask & m
+    if q:
+        m = _search_text(ds).str.contains(q.lower(), regex=False).to_numpy()
+        mask = m if mask is None else mask & m
+
+    if sort is None:
+        order = None
+    else:
+        order = _sort_order(ds, sort)
+        if descending:
+            order = order[::-1]
+
+    if mask is None:
+        # Unfiltered: slice the precomputed order directly, O(limit).
+        page = order[offset:offset + limit] if order is not None else np.arange(offset, min(n, offset + limit))
+        return n, page
+    selected = order[mask[order]] if order is not None else np.flatnonzero(mask)
+    return len(selected), selected[offset:offset + limit]
+
+
+class _BadQuery(ValueError):
+    pass
+
+
+def _int_arg(args, name, default, lo=0):
+    try:
+        value = int(args.get(name, default))
+    except (TypeError, ValueError):
+        raise _BadQuery('%s must be an integer' % name)
+    return max(lo, value)
+
+
+def _float_arg(args, name):
+    if args.get(name) in (None, ''):
+        return None
+    try:
+        return float(args[name])
+    except (TypeError, ValueError):
+        raise _BadQuery('%s must be a number' % name)
+
+
+def _check_column(col):
+    if col not in public_columns():
+        raise _BadQuery('unknown column: %s' % col)
+    return col
+
+
+def _records(frame, positions, columns=None):
+    page = with_video_columns(frame.iloc[positions])
+    if columns is not None:
+        page = page[columns]
+    return page.to_dict(orient='records')
+
+
+def _browse_page(args):
+    ds = current()
+    sort = args.get('sort') or None
+    descending = bool(sort) and sort.startswith('-')
+    if descending:
+        sort = sort[1:]
+    offset = _int_arg(args, 'offset', 0)
+    limit = min(_int_arg(args, 'limit', BROWSE_PAGE_DEFAULT, lo=1), BROWSE_PAGE_MAX)
+    filtered, page = _browse_query(
+        ds, offset=offset, limit=limit,
+        sort=_check_column(sort) if sort else None, descending=descending,
+        q=args.get('q'), brands=args.getlist('brand'), oses=args.getlist('os'),
+        price_min=_float_arg(args, 'price_min'), price_max=_float_arg(args, 'price_max'))
+    return {
+        'total': len(ds.frame),
+        'filtered': filtered,
+        'offset': offset,
+        'limit': limit,
+        'rows': _records(ds.frame, page),
+    }
+
+
+def _datatables_page(args):
+    ds = current()
+    # Columns the table asked for, in display order (columns[i][data]).
+    columns = []
+    while 'columns[%d][data]' % len(columns) in args:
+        columns.append(_check_column(args['columns[%d][data]' % len(columns)]))
+    sort, descending = None, False
+    if 'order[0][column]' in args and columns:
+        idx = _int_arg(args, 'order[0][column]', 0)
+        if idx >= len(columns):
+            raise _BadQuery('order column out of range')
+        sort = columns[idx]
+        descending = args.get('order[0][dir]') == 'desc'
+    length = _int_arg(args, 'length', BROWSE_PAGE_DEFAULT, lo=-1)
+    limit = BROWSE_PAGE_MAX if length in (-1, 0) else min(length, BROWSE_PAGE_MAX)
+    filtered, page = _browse_query(
+        ds, offset=_int_arg(args, 'start', 0), limit=limit, sort=sort, descending=descending,
+        q=args.get('search[value]'))
+    return {
+        'draw': _int_arg(args, 'draw', 0),
+        'recordsTotal': len(ds.frame),
+        'recordsFiltered': filtered,
+        'data': _records(ds.frame, page, columns or None),
+    }
+
+
+@bp.route('/debug/memory.json')
+def memory_data():
+    return jsonify(memory_report())
+
+
+@bp.route('/healthz')
+def healthz():
+    # Never touches the dataset (see _DATALESS_ENDPOINTS): answers from the
+    # moment the process is up, with `ready` once data routes will be fast too.
+    report, ds = startup_report(), _dataset
+    return jsonify(dict(report, status='ok', ready=report['dataset_loaded'],
+                        dataset_version=ds.version if ds is not None else None))
+
+
+@bp.route('/metrics')
+def metrics():
+    return Response(metrics_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@bp.route('/debug/slow.json')
+def slow_requests():
+    return jsonify({'threshold_ms': PROFILE_SLOW_MS, 'requests': list(_slow_requests)})
+
+
+@bp.route('/browse.json')
 def browse_json():
-    # Convert DataFrame to list of dictionaries
-    data = df.to_dict(orient='records')
-    
-    # JSONify
-    return jsonify(data)
+    args = request.args
+    try:
+        if 'draw' in args:
+            return jsonify(_datatables_page(args))
+        if _BROWSE_PARAMS.intersection(args):
+            return jsonify(_browse_page(args))
+    except _BadQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The whole table, streamed: one JSON array (or NDJSON, one record per line)
+    # serialized BROWSE_STREAM_ROWS records at a time, never as one big list.
+    ndjson = (args.get('format') == 'ndjson'
+              or request.accept_mimetypes.best == NDJSON_MIMETYPE)
+    return Response(stream_with_context(_stream_records(current().frame, ndjson)),
+                    mimetype=NDJSON_MIMETYPE if ndjson else 'application/json')
+
+
+BROWSE_STREAM_ROWS = int(os.environ.get('BROWSE_STREAM_ROWS', '5000'))
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def _stream_records(frame, ndjson):
+    # `frame` is bound when the response starts, so an ingest publishing a new
+    # dataset mid-stream cannot mix two versions into one body.
+    def dumps(row):
+        return current_app.json.dumps(row, separators=(',', ':'))
+
+    for start in range(0, len(frame), BROWSE_STREAM_ROWS):
+        rows = with_video_columns(frame.iloc[start:start + BROWSE_STREAM_ROWS]).to_dict(orient='records')
+        if ndjson:
+            yield ''.join(dumps(row) + '\n' for row in rows)
+        else:
+            yield ('[' if start == 0 else ',') + ','.join(dumps(row) for row in rows)
+    if not ndjson:
+        yield ']' if len(frame) else '[]'
+
+# --- Chart accumulators ---------------------------------------------------------
+# Every chart aggregate is a ratio of sums, so df is summarized once into
+# mergeable cells keyed by (brand, os, announcement_year, battery_type): row
+# count, battery-per-dollar sum, per-column sums, pairwise product sums (the
+# running moments behind the correlation matrix) and video support counts.
+# Adding or removing rows is a vectorized add/subtract of their cells (see
+# _apply_batch), never a rescan of df.
+CUBE_DIMS = ['brand', 'os', 'announcement_year', 'battery_type']
+NUMERIC_COLS = ['inches', 'battery', 'ram(GB)', 'weight(g)', 'storage(GB)',
+                'price(USD)', 'width', 'height', 'announcement_year']
+SPEC_COLS = ['height', 'ram(GB)', 'storage(GB)', 'weight(g)']
+
+
+def _cell_measures(frame):
+    """Additive chart measures for `frame`, summed per CUBE_DIMS cell."""
+    import numpy as np
+    values = frame[NUMERIC_COLS].to_numpy(dtype='float64')
+    measures = {'count': np.ones(len(frame)),
+                'efficiency': values[:, 1] / values[:, 5]}  # battery / price(USD)
+    for i, a in enumerate(NUMERIC_COLS):
+        measures['sum:' + a] = values[:, i]
+        for j in range(i, len(NUMERIC_COLS)):
+            measures['prod:%s:%s' % (a, NUMERIC_COLS[j])] = values[:, i] * values[:, j]
+    for col in VIDEO_COLS:
+        measures[col] = video_flag(frame, col).astype('float64')
+    # Plain (non-categorical) keys, so cells from frames with different
+    # category levels align when added together.
+    keys = pd.MultiIndex.from_arrays(
+        [frame[d].astype(str) if d != 'announcement_year' else frame[d].astype('int64')
+         for d in CUBE_DIMS], names=CUBE_DIMS)
+    return pd.DataFrame(measures, index=keys).groupby(level=CUBE_DIMS).sum()
+
+
+def _correlation(totals):
+    """Pearson correlation matrix of NUMERIC_COLS from summed moments."""
+    import numpy as np
+    n = totals['count']
+    k = len(NUMERIC_COLS)
+    # An empty or constant slice has undefined (NaN) entries, not an error
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.array([totals['sum:' + c] for c in NUMERIC_COLS]) / n
+        cov = np.empty((k, k))
+        for i, a in enumerate(NUMERIC_COLS):
+            for j in range(i, k):
+                cov[i, j] = cov[j, i] = totals['prod:%s:%s' % (a, NUMERIC_COLS[j])] / n - mean[i] * mean[j]
+        # Cancellation leaves a constant column a tiny (even negative) variance
+        var = np.diag(cov)
+        std = np.where(var > 1e-9 * mean ** 2, np.sqrt(np.clip(var, 0, None)), np.nan)
+        return cov / np.outer(std, std)
+
+
+def _accumulate_cells(frame, chunksize=None):
+    """_cell_measures(frame), summed over row chunks to bound the per-row measures."""
+    step = chunksize or CSV_CHUNK_ROWS
+    cells = _cell_measures(frame.iloc[:step])
+    for start in range(step, len(frame), step):
+        cells = cells.add(_cell_measures(frame.iloc[start:start + step]), fill_value=0)
+    return cells
+
 
 # Aggregated + raw data for client-side Plotly charts.
-# df is static after startup, so the payload is constant: build it once and memoize.
+# Aggregates are rolled up from the chart cells; the payload is built once (per
+# encoding) per dataset version and memoized. `columnar=True` ships the raw
+# numeric arrays as base64 little-endian float32 buffers instead of JSON number
+# lists; see charts_data().
 @functools.cache
-def _charts_payload():
-    # --- Aggregates (computed in pandas; awkward to do in JS) ---
+def _charts_payload(ds, columnar=False):
+    with _stage('charts-build'):
+        return _build_charts(ds.cells, ds.frame, columnar)
+
+
+# Filtered charts: the cube is sliced down to the matching cells (a few hundred
+# rows, not the catalog) and rolled up exactly like the full payload; only the
+# raw histogram/box arrays need a row mask over df. A dashboard slices through a
+# small set of hot combinations, so their encoded responses (and summarized
+# ones, below) sit in an LRU.
+CHART_FILTER_CACHE_SIZE = int(os.environ.get('CHART_FILTER_CACHE_SIZE', '256'))
+CHART_FILTERS = ('brand', 'os', 'battery_type')  # repeatable; plus year_min/year_max
+
+
+def _chart_filters(args):
+    """Normalized, hashable filters from query args (None when unfiltered)."""
+    filters = tuple((name, tuple(sorted(set(args.getlist(name)))))
+                    for name in CHART_FILTERS if args.getlist(name))
+    years = tuple(None if args.get(name) in (None, '') else _int_arg(args, name, 0)
+                  for name in ('year_min', 'year_max'))
+    if years != (None, None):
+        filters += (('announcement_year', years),)
+    return filters or None
+
+
+def _filter_mask(keys, filters):
+    import numpy as np
+    mask = np.ones(len(keys[CUBE_DIMS[0]]), dtype=bool)
+    for dim, wanted in filters:
+        values = keys[dim]
+        if dim != 'announcement_year':
+            mask &= np.asarray(values.isin(wanted))
+            continue
+        lo, hi = wanted
+        if lo is not None:
+            mask &= np.asarray(values >= lo)
+        if hi is not None:
+            mask &= np.asarray(values <= hi)
+    return mask
+
+
+@functools.lru_cache(maxsize=CHART_FILTER_CACHE_SIZE)
+def _sliced_charts(ds, filters, columnar=False, bins=None, sections=None):
+    """Encoded response variants for a filtered and/or summarized charts payload.
+
+    With `sections` (a tuple of names), only those sections of it.
+    """
+    cells, frame = ds.cells, ds.frame
+    if filters is not None:
+        cells = cells[_filter_mask({d: cells.index.get_level_values(d) for d in CUBE_DIMS}, filters)]
+        if sections is None or set(sections) & set(RAW_SECTIONS):
+            frame = frame[_filter_mask({d: frame[d] for d in CUBE_DIMS}, filters)]
+    with _stage('charts-build'):
+        payload = _build_charts(cells, frame, columnar, bins, sections)
+    if filters is not None:
+        payload['filters'] = dict(filters)
+    return _encode_variants(current_app.json.dumps(payload).encode('utf-8'))
+
+
+# Summary mode (`summary=1`): histograms as bin edges + counts and boxes as
+# precomputed quartiles/whiskers instead of every raw value, so the payload has
+# the same size for 1.5k or 1.5M phones.
+CHART_SUMMARY_BINS = int(os.environ.get('CHART_SUMMARY_BINS', '30'))
+CHART_MAX_BINS = 200
+BOX_OUTLIER_CAP = int(os.environ.get('BOX_OUTLIER_CAP', '50'))
+
+
+def _histogram(values, bins):
+    import numpy as np
+    values = np.asarray(values, dtype='float64')
+    if values.size == 0:
+        return {'edges': [], 'counts': []}
+    counts, edges = np.histogram(values, bins=bins)
+    return {'edges': [round(float(e), 4) for e in edges],
+            'counts': [int(c) for c in counts]}
+
+
+def _box_stats(values):
+    """Tukey box-plot statistics (Plotly's linear quartiles) with capped outliers."""
+    import numpy as np
+    values = np.sort(np.asarray(values, dtype='float64'))
+    if values.size == 0:
+        return {'n': 0}
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    reach = 1.5 * (q3 - q1)
+    inside = values[(values >= q1 - reach) & (values <= q3 + reach)]
+    outliers = values[(values < q1 - reach) | (values > q3 + reach)]
+    if len(outliers) > BOX_OUTLIER_CAP:
+        # Keep the most extreme ones; the rest are drawn as part of the spread
+        outliers = np.sort(outliers[np.argsort(-abs(outliers - median), kind='stable')[:BOX_OUTLIER_CAP]])
+    return {'n': int(values.size),
+            'q1': round(float(q1), 2), 'median': round(float(median), 2),
+            'q3': round(float(q3), 2), 'mean': round(float(values.mean()), 2),
+            'lowerfence': round(float(inside[0]), 2), 'upperfence': round(float(inside[-1]), 2),
+            'outliers': [round(float(v), 2) for v in outliers]}
+
+
+def _round_or_none(v, digits):
+    import numpy as np
+    # Correlations are undefined (NaN) for a constant column, e.g. a one-year slice
+    return round(float(v), digits) if np.isfinite(v) else None
+
+
+# Chart sections: each top-level key of the charts payload has its own builder,
+# (cells, frame, columnar, bins) -> value, so a section can also be built and
+# served on its own (see /data/charts/<section>.json). Aggregates are rolled up
+# from the chart cells; only RAW_SECTIONS read rows of `frame`.
+CHART_SECTIONS = {}  # name -> builder
+RAW_SECTIONS = ('price_by_os', 'histograms')
+# Operating systems with fewer phones are grouped into "Other".
+OS_THRESHOLD = 40
+
+
+def _chart_section(name):
+    def register(build):
+        CHART_SECTIONS[name] = build
+        return build
+    return register
+
+
+def _build_charts(cells, frame, columnar, bins=None, sections=None):
+    """The charts payload, or just the named `sections` of it."""
+    return {name: build(cells, frame, columnar, bins) for name, build in CHART_SECTIONS.items()
+            if sections is None or name in sections}
+
+
+def _rollup(cells, dim):
+    # groupby sorts the keys, so the stable sorts below break ties by name
+    return cells.groupby(level=dim).sum()
+
+
+def _counts(cells, dim):
+    return _rollup(cells, dim)['count'].sort_values(ascending=False, kind='stable')
+
+
+def _by_brand(values):
+    s = values.sort_values(ascending=False, kind='stable')
+    return {'brands': [str(b) for b in s.index],
+            'values': [round(float(v), 2) for v in s.values]}
+
+
+def _major_os(cells):
+    """OS counts of the major operating systems, and the total of the rest.
+
+    The OS pie and the price-by-OS boxes share it, so the two charts can't
+    disagree about which operating systems are major.
+    """
+    os_counts = _counts(cells, 'os')
+    return (os_counts[os_counts >= OS_THRESHOLD],
+            int(os_counts[os_counts < OS_THRESHOLD].sum()))
+
+
+def _raw(values, digits, columnar):
+    # Raw arrays: Plotly bins / builds distributions client-side
+    if columnar:
+        return _float32_column(values)
+    return [round(float(v), digits) for v in values]
+
+
+@_chart_section('brand_counts')
+def _brand_counts(cells, frame, columnar, bins):
+    return {str(k): int(v) for k, v in _counts(cells, 'brand').items()}
 
-    # Brand distribution
-    brand_counts = df['brand'].value_counts()
 
-    # OS distribution, grouping rare operating systems into "Other"
-    os_threshold = 40
-    os_counts = df['os'].value_counts()
-    os_main = os_counts[os_counts >= os_threshold]
-    os_other = int(os_counts[os_counts < os_threshold].sum())
+@_chart_section('os_counts')
+def _os_counts(cells, frame, columnar, bins):
+    os_main, os_other = _major_os(cells)
     os_data = {str(k): int(v) for k, v in os_main.items()}
     if os_other > 0:
         os_data['Other'] = os_other
+    return os_data
 
-    # Battery type distribution
-    battery_counts = df['battery_type'].value_counts()
-
-    # Video format support (True/False counts per capability)
-    video_cols = ['video_720p', 'video_1080p', 'video_4K', 'video_8K',
-                  'video_30fps', 'video_60fps', 'video_120fps', 'video_240fps',
-                  'video_480fps', 'video_960fps']
-    video_data = {}
-    for col in video_cols:
-        counts = df[col].value_counts()
-        video_data[col] = {
-            'true': int(counts.get(True, 0)),
-            'false': int(counts.get(False, 0)),
-        }
-
-    # Average price by brand (sorted high to low)
-    avg_price = df.groupby('brand')['price(USD)'].mean().sort_values(ascending=False)
-
-    # Battery efficiency (mAh per USD) by brand — computed without mutating df
-    efficiency = (df['battery'] / df['price(USD)'])
-    avg_eff = efficiency.groupby(df['brand']).mean().sort_values(ascending=False)
-
-    # Average specs by brand
-    spec_cols = ['height', 'ram(GB)', 'storage(GB)', 'weight(g)']
-    specs_data = {}
-    for spec in spec_cols:
-        s = df.groupby('brand')[spec].mean().sort_values(ascending=False)
-        specs_data[spec] = {
-            'brands': [str(b) for b in s.index],
-            'values': [round(float(v), 2) for v in s.values],
-        }
-
-    # Correlation matrix for numeric features
-    numeric_cols = ['inches', 'battery', 'ram(GB)', 'weight(g)', 'storage(GB)',
-                    'price(USD)', 'width', 'height', 'announcement_year']
-    corr = df[numeric_cols].corr()
-
-    # Yearly market trends
-    releases_by_year = df.groupby('announcement_year').size()
-    avg_price_by_year = df.groupby('announcement_year')['price(USD)'].mean()
-
-    # --- Raw arrays (Plotly bins / builds distributions client-side) ---
-
-    # Price by OS for boxplot — reuse the same "major OS" set as the pie's grouping
-    # so the two charts can't disagree about which operating systems are major.
-    major_os = os_main.index
-    box_data = {
-        str(os_name): [round(float(p), 2)
-                       for p in df[df['os'] == os_name]['price(USD)'].dropna()]
-        for os_name in major_os
-    }
 
-    # Raw columns for histograms
-    hist_cols = numeric_cols
-    hist_data = {col: [round(float(v), 4) for v in df[col].dropna()] for col in hist_cols}
+@_chart_section('battery_type_counts')
+def _battery_type_counts(cells, frame, columnar, bins):
+    return {str(k): int(v) for k, v in _counts(cells, 'battery_type').items()}
 
-    return {
-        'brand_counts': {str(k): int(v) for k, v in brand_counts.items()},
-        'os_counts': os_data,
-        'battery_type_counts': {str(k): int(v) for k, v in battery_counts.items()},
-        'video_formats': video_data,
-        'avg_price_by_brand': {
-            'brands': [str(b) for b in avg_price.index],
-            'values': [round(float(v), 2) for v in avg_price.values],
-        },
-        'battery_efficiency_by_brand': {
-            'brands': [str(b) for b in avg_eff.index],
-            'values': [round(float(v), 2) for v in avg_eff.values],
-        },
-        'specs_by_brand': specs_data,
-        'correlation': {
-            'labels': numeric_cols,
-            'matrix': [[round(float(v), 2) for v in row] for row in corr.values],
-        },
-        'yearly_trends': {
-            'years': [str(y) for y in releases_by_year.index],
-            'releases': [int(v) for v in releases_by_year.values],
-            'avg_price': [round(float(v), 2) for v in avg_price_by_year.values],
-        },
-        'price_by_os': box_data,
-        'histograms': hist_data,
-    }
+
+@_chart_section('video_formats')
+def _video_formats(cells, frame, columnar, bins):
+    # True/False counts per capability
+    total = cells.sum()
+    n = int(total['count'])
+    return {col: {'true': int(total[col]), 'false': n - int(total[col])} for col in VIDEO_COLS}
+
+
+@_chart_section('avg_price_by_brand')
+def _avg_price_by_brand(cells, frame, columnar, bins):
+    brands = _rollup(cells, 'brand')
+    return _by_brand(brands['sum:price(USD)'] / brands['count'])
+
+
+@_chart_section('battery_efficiency_by_brand')
+def _battery_efficiency_by_brand(cells, frame, columnar, bins):
+    # mAh per USD
+    brands = _rollup(cells, 'brand')
+    return _by_brand(brands['efficiency'] / brands['count'])
+
+
+@_chart_section('specs_by_brand')
+def _specs_by_brand(cells, frame, columnar, bins):
+    brands = _rollup(cells, 'brand')
+    return {spec: _by_brand(brands['sum:' + spec] / brands['count']) for spec in SPEC_COLS}
+
+
+@_chart_section('correlation')
+def _correlation_section(cells, frame, columnar, bins):
+    corr = _correlation(cells.sum())
+    return {'labels': NUMERIC_COLS,
+            'matrix': [[_round_or_none(v, 2) for v in row] for row in corr]}
+
+
+@_chart_section('yearly_trends')
+def _yearly_trends(cells, frame, columnar, bins):
+    years = _rollup(cells, 'announcement_year')
+    releases = years['count']
+    avg_price = years['sum:price(USD)'] / years['count']
+    return {'years': [str(y) for y in releases.index],
+            'releases': [int(v) for v in releases.values],
+            'avg_price': [round(float(v), 2) for v in avg_price.values]}
+
+
+@_chart_section('price_by_os')
+def _price_by_os(cells, frame, columnar, bins):
+    def box(values):
+        return _box_stats(values) if bins else _raw(values, 2, columnar)
+
+    return {str(os_name): box(frame.loc[frame['os'] == os_name, 'price(USD)'].dropna())
+            for os_name in _major_os(cells)[0].index}
+
+
+@_chart_section('histograms')
+def _histograms_section(cells, frame, columnar, bins):
+    # Raw columns (or their bins, in summary mode)
+    def hist(values):
+        return _histogram(values, bins) if bins else _raw(values, 4, columnar)
+
+    return {col: hist(frame[col].dropna()) for col in NUMERIC_COLS}
+
+
+def _float32_column(values):
+    """Encode a numeric column as a base64 little-endian float32 buffer.
+
+    One vectorized cast + one bytes copy, instead of a Python float per element;
+    the browser decodes it straight into a Float32Array, which Plotly accepts.
+    """
+    import numpy as np
+    buf = np.ascontiguousarray(values, dtype='<f4')
+    return {'dtype': 'float32', 'encoding': 'base64', 'length': int(buf.size),
+            'data': base64.b64encode(buf.tobytes()).decode('ascii')}
 
 
-@app.route('/data/charts.json')
+# Media type for the columnar encoding, for clients that negotiate via Accept.
+COLUMNAR_MIMETYPE = 'application/vnd.phone-dashboard.columnar+json'
+
+
+@bp.route('/data/charts.json')
 def charts_data():
-    return jsonify(_charts_payload())
+    return _charts_response()
+
+
+def _charts_response(sections=None):
+    """The charts payload (or a tuple of its `sections`) for the request's query."""
+    fmt = request.args.get('format')
+    if fmt is None and request.accept_mimetypes.best == COLUMNAR_MIMETYPE:
+        fmt = 'columnar'
+    if fmt not in (None, 'json', 'columnar'):
+        return jsonify({'error': 'format must be json or columnar'}), 400
+    args = request.args
+    try:
+        filters = _chart_filters(args)
+        bins = None
+        if args.get('summary', '0') not in ('0', 'false', ''):
+            bins = min(_int_arg(args, 'bins', CHART_SUMMARY_BINS, lo=1), CHART_MAX_BINS)
+    except _BadQuery as e:
+        return jsonify({'error': str(e)}), 400
+    # Summaries carry no raw arrays, so there is nothing to encode columnar
+    columnar = fmt == 'columnar' and bins is None
+    mimetype = COLUMNAR_MIMETYPE if columnar else 'application/json'
+    if sections is not None and not set(sections) & set(RAW_SECTIONS):
+        columnar = False  # nor in aggregate-only sections: share the JSON body
+    if filters is not None or bins is not None:
+        misses = _sliced_charts.cache_info().misses
+        ds = current()
+        variants = _coalesced(('charts-sliced', ds.version, filters, columnar, bins, sections),
+                              lambda: _sliced_charts(ds, filters, columnar, bins, sections))
+        _count('cache_requests_total', cache='charts-sliced',
+               result='miss' if _sliced_charts.cache_info().misses != misses else 'hit')
+        response = _send_variant(variants, mimetype)
+        response.vary.add('Accept')
+        return response
+    name = 'charts-columnar' if columnar else 'charts'
+    if sections is None:
+        render = lambda: current_app.json.dumps(_charts_payload(current(), columnar=columnar))
+    else:
+        name += ':' + ','.join(sections)
+        render = lambda: current_app.json.dumps(_chart_sections_payload(sections, columnar))
+    response = _cached_response(name, render, mimetype)
+    response.vary.add('Accept')
+    return response
+
+
+def _chart_sections_payload(sections, columnar):
+    ds = current()
+    with _stage('charts-build'):
+        return _build_charts(ds.cells, ds.frame, columnar, sections=sections)
 
 
 # Modeling-driven insights: what drives price, which phones are best value, and
-# how the market segments into tiers. Trained once (df is static) and memoized.
-@functools.cache
+# how the market segments into tiers. Trained once per dataset version, always
+# off the request path: a single background thread loads the version's artifact
+# (see `flask --app main warm`) or trains and writes it, then publishes the
+# result with one reference assignment. Requests keep getting the previous
+# payload until the swap; only a process with no payload at all waits, and
+# concurrent waiters share the same training run.
+_insights_current = None  # {'version': dataset key, 'payload': dict}
+INSIGHTS_WAIT_SECONDS = float(os.environ.get('INSIGHTS_WAIT_SECONDS', '30'))
+_train_lock = threading.Lock()
+_train_executor = None
+_train_pending = None  # queued job; trains whatever version is current when it starts
+_train_running = None  # (version, future) of the job in progress
+# (version, future) of the last job that raised. It is logged once and not
+# retried for that version: requests keep the previous payload (or get the
+# error) until the next dataset version or restart, instead of each starting
+# another full training run.
+_train_failed = None
+
+
+def _reset_training_state():
+    # Threads do not survive fork(): a child (e.g. a gunicorn worker forked
+    # from a preloaded master) needs its own executor and an unheld lock.
+    global _train_lock, _train_executor, _train_pending, _train_running
+    _train_lock = threading.Lock()
+    _train_executor = _train_pending = _train_running = None
+
+
+os.register_at_fork(after_in_child=_reset_training_state)
+
+
+def _schedule_training():
+    """Ensure the current dataset version is (being) trained; returns the job's future."""
+    global _train_executor, _train_pending
+    with _train_lock:
+        if _train_pending is not None:
+            return _train_pending
+        if _train_running is not None and _train_running[0] == _dataset.version:
+            return _train_running[1]
+        if _train_failed is not None and _train_failed[0] == _dataset.version:
+            return _train_failed[1]
+        if _train_executor is None:
+            _train_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='insights')
+        _train_pending = _train_executor.submit(_train_job)
+        return _train_pending
+
+
+def _train_job():
+    global _insights_current, _train_pending, _train_running, _train_failed
+    with _train_lock:
+        version, frame = _dataset.version, _dataset.frame
+        _train_running, _train_pending = (version, _train_pending), None
+    try:
+        payload = _load_or_train(version, frame)
+        _insights_current = {'version': version, 'payload': payload}
+        return payload
+    except Exception:
+        log.exception('training insights for dataset version %s failed', version)
+        _count('training_failures_total')
+        with _train_lock:
+            _train_failed = _train_running
+        raise
+    finally:
+        with _train_lock:
+            _train_running = None
+
+
+def _load_or_train(version, frame):
+    """The insights payload for `version`: from its artifact, else trained and saved.
+
+    Processes that are not forked from a preloaded master (PRELOAD=0, several
+    machines on one shared ARTIFACT_DIR) all miss at once on a new version; a
+    per-version file lock lets one of them train while the others wait and then
+    read its artifact.
+    """
+    payload = _read_artifact('insights.json', version)
+    if payload is None:
+        with _artifact_lock(version):
+            payload = _read_artifact('insights.json', version)
+            if payload is None:
+                _count('cache_requests_total', cache='insights-artifact', result='miss')
+                return _train_and_save(version, frame)
+    _count('cache_requests_total', cache='insights-artifact', result='hit')
+    return payload
+
+
+def _train_and_save(version, frame):
+    started = time.perf_counter()
+    with _stage('train'):
+        payload, residents = _train_insights(frame)
+    for name, obj in residents.items():
+        _keep_resident(name, version, obj)
+    payload.setdefault('meta', {}).update({
+        'model_version': version,
+        'trained_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'training_seconds': round(time.perf_counter() - started, 3),
+        'rows': len(frame),
+    })
+    _write_artifact('insights.json', payload, version)
+    return payload
+
+
+@contextlib.contextmanager
+def _artifact_lock(version):
+    """Exclusive, cross-process lock on a dataset version's artifacts."""
+    path = _artifact_path('.lock', version)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, 'a')
+    except OSError:
+        yield  # read-only artifact dir: nothing is shared, so nothing to lock
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 def _insights_payload():
+    published = _insights_current
+    if published is not None and published['version'] == current().version:
+        _count('cache_requests_total', cache='insights', result='hit')
+        return published['payload']
+    future = _schedule_training()
+    if published is not None:
+        _count('cache_requests_total', cache='insights', result='stale')
+        return published['payload']  # stale but complete; swapped once retrained
+    _count('cache_requests_total', cache='insights', result='miss')
+    # A request gives up after INSIGHTS_WAIT_SECONDS (answered 503 + Retry-After,
+    # see _training_not_ready) rather than running into the worker timeout;
+    # training carries on regardless. Outside requests (warm, CLI) wait it out.
+    with _stage('insights-wait'):
+        return future.result(timeout=INSIGHTS_WAIT_SECONDS if has_request_context() else None)
+
+
+@bp.app_errorhandler(TimeoutError)
+def _training_not_ready(e):
+    response = jsonify({'error': 'models are still training; retry shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+
+# --- Training -------------------------------------------------------------------
+# The models themselves live in modeling.py, the only module that imports
+# sklearn; it is imported here on the first training run, so serving pages and
+# charts never loads it. Its stages run under an explicit CPU/memory budget
+# (TRAIN_JOBS, TRAIN_MEMORY_MB, TRAIN_BACKEND; see modeling.py).
+def _train_insights(frame):
+    """Train every insights model on `frame`; returns (payload, resident artifacts by name)."""
+    import modeling
+    payload, residents = modeling.train_insights(frame, MODEL_PARAMS)
+    for name, seconds in payload['meta']['training']['timings'].items():
+        if name != 'total':
+            _observe('stage_duration_seconds', seconds, stage='train-' + name)
+    return payload, residents
+
+
+@bp.route('/data/insights.json')
+def insights_data():
+    payload = _insights_payload()
+    version = payload['meta']['model_version']
+    response = _cached_response('insights', lambda: current_app.json.dumps(payload),
+                                'application/json', version=version)
+    response.headers['X-Model-Version'] = version
+    return response
+
+
+# --- Chart sections ---------------------------------------------------------------
+# The dashboard fetches data per chart, as each one is first shown, instead of
+# both whole payloads up front: /data/charts/<section>.json serves one charts
+# section (same query parameters as /data/charts.json) or one part of the
+# insights payload, each rendered and cached on its own. A section's body is a
+# fragment of the combined payload ({"tiers": {...}}), which the client merges
+# one level deep. /data/charts/manifest.json lists them; it also starts
+# training in the background, since the model sections are usually next.
+INSIGHT_SECTIONS = {  # name -> the payload fragment it serves
+    'price_model': lambda p: {'price_model': {k: v for k, v in p['price_model'].items()
+                                              if k != 'pred_vs_actual'}},
+    'pred_vs_actual': lambda p: {'price_model': {
+        'pred_vs_actual': p['price_model']['pred_vs_actual']}},
+    'value_ranking': lambda p: {'value_ranking': p['value_ranking']},
+    'tiers': lambda p: {'tiers': p['tiers']},
+}
+
+
+@bp.route('/data/charts/manifest.json')
+def chart_manifest():
+    ds, published = current(), _insights_current
+    model_ready = published is not None and published['version'] == ds.version
+    if not model_ready:
+        _schedule_training()
+    sections = {name: {'url': url_for('dashboard.chart_section', section=name),
+                       'source': 'charts', 'raw': name in RAW_SECTIONS}
+                for name in CHART_SECTIONS}
+    sections.update({name: {'url': url_for('dashboard.chart_section', section=name),
+                            'source': 'insights', 'raw': False}
+                     for name in INSIGHT_SECTIONS})
+    return jsonify({'dataset_version': ds.version, 'model_ready': model_ready,
+                    'model_version': published['version'] if published else None,
+                    'sections': sections})
+
+
+@bp.route('/data/charts/<section>.json')
+def chart_section(section):
+    if section in CHART_SECTIONS:
+        return _charts_response((section,))
+    if section not in INSIGHT_SECTIONS:
+        return jsonify({'error': 'unknown section: %s' % section}), 404
+    payload = _insights_payload()
+    version = payload['meta']['model_version']
+    response = _cached_response(
+        'insights:' + section,
+        lambda: current_app.json.dumps(INSIGHT_SECTIONS[section](payload)),
+        'application/json', version=version)
+    response.headers['X-Model-Version'] = version
+    return response
+
+
+@bp.cli.command('memory')
+def memory_command():
+    """Print df's per-column memory footprint and the process peak RSS."""
+    load()
+    report = memory_report()
+    for c in report['columns']:
+        print('%-20s %-12s %10d' % (c['column'], c['dtype'], c['bytes']))
+    print('%-33s %10d  (%d rows)' % ('total', report['total_bytes'], report['rows']))
+    print('%-33s %10d' % ('peak RSS', report['peak_rss_bytes']))
+
+
+# --- Resident model artifacts -----------------------------------------------------
+# Binary by-products of training that requests query directly: the held-out
+# random forest (/predict) and the full-catalog value index (/data/value). Each
+# is saved next to the insights artifact, so a process that loaded the payload
+# from disk loads it once on first use instead of retraining, and is kept per
+# model version so it always matches the payload being served.
+_resident = {}  # artifact name -> (model version, object)
+
+
+def _keep_resident(name, version, obj):
+    """Save a training by-product for `version` and make it resident here."""
+    import modeling
+    path = _artifact_path(name, version)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            modeling.dump_artifact(name, obj, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning('could not write %s: %s', path, e)
+    _resident[name] = (version, obj)
+
+
+def _resident_artifact(name):
+    """(version, object) for `name`, matching the insights payload being served."""
+    import modeling
+    version = _insights_payload()['meta']['model_version']
+    held = _resident.get(name)
+    if held is None or held[0] != version:
+        held = (version, modeling.load_artifact(name, _artifact_path(name, version)))
+        _resident[name] = held
+    return held
+
+
+# --- Price prediction -------------------------------------------------------------
+# Recent /predict latencies (seconds), for the p50/p99 report.
+_predict_latencies = collections.deque(maxlen=2000)
+PREDICT_BATCH_MAX = 10000
+
+
+def predict_prices(specs):
+    """Predicted price and value residual for each spec dict, in one predict() call."""
+    feature_cols = MODEL_PARAMS['feature_cols']
+    frame = pd.DataFrame.from_records(specs)
+    missing = [c for c in feature_cols if c not in frame.columns]
+    if missing:
+        raise ValueError('specs missing fields: %s' % ', '.join(missing))
+    try:
+        X = frame[feature_cols].to_numpy(dtype='float64')
+    except (TypeError, ValueError):
+        raise ValueError('spec fields must be numeric')
+    if pd.isna(X).any():
+        raise ValueError('specs have empty fields')
+    version, model = _resident_artifact('price_model.joblib')
+    predicted = model.predict(X)
+    actual = (pd.to_numeric(frame['price(USD)'], errors='coerce').to_numpy()
+              if 'price(USD)' in frame.columns else None)
+    rows = []
+    for i, p in enumerate(predicted):
+        # Value residual, as in value_ranking: positive = priced below its specs.
+        residual = None
+        if actual is not None and not pd.isna(actual[i]):
+            residual = round(float(p - actual[i]), 2)
+        rows.append({'predicted': round(float(p), 2), 'residual': residual})
+    return version, rows
+
+
+def _latency_report():
     import numpy as np
-    from sklearn.model_selection import train_test_split, cross_val_predict
-    from sklearn.linear_model import LinearRegression
-    from sklearn.ensemble import RandomForestRegressor
-    from sklearn.preprocessing import StandardScaler
-    from sklearn.pipeline import make_pipeline
-    from sklearn.cluster import KMeans
-    from sklearn.metrics import r2_score, mean_absolute_error
-
-    feature_cols = ['inches', 'battery', 'ram(GB)', 'weight(g)', 'storage(GB)',
-                    'width', 'height', 'announcement_year']
-    model_df = df.dropna(subset=feature_cols + ['price(USD)']).reset_index(drop=True)
-    X = model_df[feature_cols]
-    y = model_df['price(USD)']
-
-    # --- 1. Price-driver model: compare linear vs random forest, report importance ---
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42)
-
-    linear = make_pipeline(StandardScaler(), LinearRegression())
-    linear.fit(X_train, y_train)
-    lin_pred = linear.predict(X_test)
-
-    # n_jobs=1: on shared hosts n_jobs=-1 forks one job per detected CPU, each
-    # copying the data, which OOMs small (e.g. 512 MB) instances. The dataset is
-    # small enough that single-threaded is fast and memory-safe.
-    rf = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=1)
-    rf.fit(X_train, y_train)
-    rf_pred = rf.predict(X_test)
-
-    metrics = {
-        'linear': {'r2': round(float(r2_score(y_test, lin_pred)), 3),
-                   'mae': round(float(mean_absolute_error(y_test, lin_pred)), 1)},
-        'random_forest': {'r2': round(float(r2_score(y_test, rf_pred)), 3),
-                          'mae': round(float(mean_absolute_error(y_test, rf_pred)), 1)},
-    }
+    latencies = np.array(_predict_latencies) * 1000
+    if not len(latencies):
+        return {'requests': 0, 'p50_ms': None, 'p99_ms': None}
+    return {'requests': len(latencies),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 3)}
 
-    importance = sorted(
-        ({'feature': f, 'importance': round(float(i), 4)}
-         for f, i in zip(feature_cols, rf.feature_importances_)),
-        key=lambda d: d['importance'], reverse=True)
 
-    pred_vs_actual = {
-        'actual': [round(float(v), 2) for v in y_test],
-        'predicted': [round(float(v), 2) for v in rf_pred],
-    }
+VALUE_K_MAX = 500
 
-    # --- 2. Best-value ranking: out-of-fold residual (predicted - actual). A phone
-    #        priced below what its specs predict is good value (positive residual). ---
-    oof_pred = cross_val_predict(
-        RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=1), X, y, cv=5)
-    ranked = model_df.assign(
-        predicted=oof_pred, residual=oof_pred - y.values
-    ).sort_values('residual', ascending=False)
-
-    def value_row(r):
-        return {
-            'name': str(r['phone_name']),
-            'brand': str(r['brand']),
-            'actual': round(float(r['price(USD)']), 0),
-            'predicted': round(float(r['predicted']), 0),
-            'residual': round(float(r['residual']), 0),
-        }
-
-    value_ranking = {
-        'best': [value_row(r) for _, r in ranked.head(15).iterrows()],
-        'worst': [value_row(r) for _, r in ranked.tail(15).iloc[::-1].iterrows()],
-    }
 
-    # --- 3. Market tiers via k-means, ordered by mean price -> budget/mid/flagship ---
-    cluster_cols = ['price(USD)', 'battery', 'ram(GB)', 'storage(GB)', 'inches', 'weight(g)']
-    cluster_df = df.dropna(subset=cluster_cols).reset_index(drop=True)
-    scaled = StandardScaler().fit_transform(cluster_df[cluster_cols])
-    raw_labels = KMeans(n_clusters=3, random_state=42, n_init=10).fit_predict(scaled)
-
-    # Map raw cluster ids -> tier rank (0=cheapest) by ascending mean price
-    order = (cluster_df.assign(c=raw_labels)
-             .groupby('c')['price(USD)'].mean().sort_values().index.tolist())
-    rank_of = {c: i for i, c in enumerate(order)}
-    tier_idx = [rank_of[c] for c in raw_labels]
-    tier_names = ['Budget', 'Mid-range', 'Flagship']
-
-    summary = []
-    for i, c in enumerate(order):
-        grp = cluster_df[raw_labels == c]
-        summary.append({
-            'tier': tier_names[i],
-            'count': int(len(grp)),
-            'mean_price': round(float(grp['price(USD)'].mean()), 0),
-            'mean_ram': round(float(grp['ram(GB)'].mean()), 1),
-            'mean_battery': round(float(grp['battery'].mean()), 0),
-            'mean_storage': round(float(grp['storage(GB)'].mean()), 0),
-        })
+@bp.route('/data/value')
+def value_data():
+    import modeling
+    args = request.args
+    try:
+        order = args.get('order', 'best')
+        if order not in ('best', 'worst'):
+            raise _BadQuery('order must be best or worst')
+        try:
+            years = [int(y) for y in args.getlist('year')]
+        except ValueError:
+            raise _BadQuery('year must be an integer')
+        tiers = []
+        for t in args.getlist('tier'):
+            if t not in modeling.TIER_NAMES:
+                raise _BadQuery('tier must be one of: %s' % ', '.join(modeling.TIER_NAMES))
+            tiers.append(modeling.TIER_NAMES.index(t))
+        query = dict(order=order, k=min(_int_arg(args, 'k', 15, lo=1), VALUE_K_MAX),
+                     brands=args.getlist('brand'), years=years, tiers=tiers,
+                     price_min=_float_arg(args, 'price_min'),
+                     price_max=_float_arg(args, 'price_max'))
+    except _BadQuery as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        version, index = _resident_artifact('value_index.npz')
+    except FileNotFoundError:
+        return jsonify({'error': 'value index not available yet'}), 503
+    matches, positions = modeling.query_value_index(index, **query)
+    return jsonify({'model_version': version, 'order': order, 'matches': matches,
+                    'phones': modeling.value_rows(index, positions, detail=True)})
 
-    tiers = {
-        'names': tier_names,
-        'summary': summary,
-        'points': {
-            'storage': [round(float(v), 0) for v in cluster_df['storage(GB)']],
-            'price': [round(float(v), 2) for v in cluster_df['price(USD)']],
-            'tier': tier_idx,
-        },
-    }
 
-    return {
-        'price_model': {'metrics': metrics, 'importance': importance,
-                        'pred_vs_actual': pred_vs_actual},
-        'value_ranking': value_ranking,
-        'tiers': tiers,
-    }
+@bp.route('/predict', methods=['GET', 'POST'])
+def predict():
+    if request.method == 'GET':
+        return jsonify(_latency_report())
+    started = time.perf_counter()
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and 'specs' in body:
+        body = body['specs']
+    specs = [body] if isinstance(body, dict) else body
+    if not isinstance(specs, list) or not specs or not all(isinstance(s, dict) for s in specs):
+        return jsonify({'error': 'expected a spec object or a list of them'}), 400
+    if len(specs) > PREDICT_BATCH_MAX:
+        return jsonify({'error': 'at most %d specs per request' % PREDICT_BATCH_MAX}), 400
+    try:
+        version, rows = predict_prices(specs)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({'error': 'price model not available yet'}), 503
+    elapsed = time.perf_counter() - started
+    _predict_latencies.append(elapsed)
+    return jsonify({'model_version': version, 'predictions': rows,
+                    'latency_ms': round(elapsed * 1000, 3), **_latency_report()})
 
 
-@app.route('/data/insights.json')
-def insights_data():
-    return jsonify(_insights_payload())
+# --- Similar phones ---------------------------------------------------------------
+# A KD-tree over the standardized spec columns (MODEL_PARAMS['feature_cols'],
+# the price model's inputs) answers "which phones are most like this one".
+# Price stays out of the distance so it can be a constraint instead ("...and
+# cheaper"). The tree is built once per dataset version; a constrained query
+# asks the tree for a few times k neighbours and widens until k of them pass
+# the filters, so no query scans df.
+SIMILAR_K_MAX = 100
+SIMILAR_BATCH_MAX = 1000
+
+
+@functools.cache
+def _similarity_index(ds):
+    import modeling
+    return modeling.build_similarity_index(ds.frame, MODEL_PARAMS['feature_cols'])
+
+
+def _similarity_query(index, query):
+    """(standardized spec vector, tree position of the phone itself or -1, its price)."""
+    import numpy as np
+    cols = MODEL_PARAMS['feature_cols']
+    if 'name' in query:
+        hits = [i for i in index['by_name'].get(str(query['name']), [])
+                if query.get('brand') in (None, index['brand'][i])]
+        if not hits:
+            raise LookupError('unknown phone: %s' % query['name'])
+        if len(hits) > 1:
+            raise ValueError('%s is ambiguous; pass its brand' % query['name'])
+        i = hits[0]
+        return index['points'][i], i, index['price'][i]
+    try:
+        specs = np.array([float(query[c]) for c in cols])
+    except KeyError as e:
+        raise ValueError('query needs a name or every spec field (missing %s)' % e)
+    except (TypeError, ValueError):
+        raise ValueError('spec fields must be numeric')
+    price = query.get('price(USD)')
+    return (specs - index['mean']) / index['std'], -1, np.nan if price is None else float(price)
+
+
+def _similar_options(query):
+    """A query's validated constraints: k, price bounds, cheaper and brands."""
+    brands = query.get('brands')
+    if isinstance(brands, str):
+        brands = [brands]
+    if brands is not None and not (isinstance(brands, list)
+                                   and all(isinstance(b, str) for b in brands)):
+        raise _BadQuery('brands must be a list of brand names')
+    return {'k': min(_int_arg(query, 'k', 10, lo=1), SIMILAR_K_MAX),
+            'price_min': _float_arg(query, 'price_min'),
+            'price_max': _float_arg(query, 'price_max'),
+            'cheaper': str(query.get('cheaper', '')).lower() in ('1', 'true'),
+            'brands': brands or None}
+
+
+def similar_phones(queries):
+    """The nearest phones for each query, honouring its constraints.
+
+    A query is {'name', optional 'brand'} or a full spec dict, plus optional
+    'k', 'price_min', 'price_max', 'cheaper' (than the query phone) and
+    'brands' (restrict results to these).
+    """
+    import numpy as np
+    options = [_similar_options(q) for q in queries]  # reject bad input before any lookup
+    ds = current()
+    index = _similarity_index(ds)
+    n = len(index['rows'])
+    resolved = [_similarity_query(index, q) for q in queries]
+    ks = [o['k'] for o in options]
+    for o, (_, _, price) in zip(options, resolved):
+        if o['cheaper'] and np.isnan(price):
+            raise ValueError('cheaper needs the query phone\'s price(USD)')
+    results = [None] * len(queries)
+    pending = list(range(len(queries)))
+    fetch = min(n, 4 * max(ks) + 1)
+    while pending:
+        distances, found = index['tree'].query(np.array([resolved[i][0] for i in pending]),
+                                               k=fetch)
+        still = []
+        for i, dist, positions in zip(pending, distances, found):
+            o, (_, itself, price) = options[i], resolved[i]
+            keep = positions != itself
+            candidate_price = index['price'][positions]
+            if o['price_min'] is not None:
+                keep &= candidate_price >= o['price_min']
+            if o['price_max'] is not None:
+                keep &= candidate_price <= o['price_max']
+            if o['cheaper']:
+                keep &= candidate_price < price
+            if o['brands']:
+                keep &= np.isin(index['brand'][positions], o['brands'])
+            hits = positions[keep][:ks[i]]
+            if len(hits) < ks[i] and fetch < n:
+                still.append(i)  # too few passed the filters: widen and retry
+            else:
+                results[i] = hits, dist[keep][:ks[i]]
+        pending, fetch = still, min(n, fetch * 4)
+
+    # One row lookup for the whole batch, split back per query
+    columns = ['phone_name', 'brand', 'price(USD)'] + MODEL_PARAMS['feature_cols']
+    hits = np.concatenate([h for h, _ in results])
+    phones = ds.frame[columns].iloc[index['rows'][hits]].to_dict(orient='records')
+    for phone, d in zip(phones, np.concatenate([d for _, d in results])):
+        phone['distance'] = round(float(d), 4)
+    bounds = np.cumsum([0] + [len(h) for h, _ in results])
+    return [phones[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _similar_constraints(source):
+    """Query constraints from request args or a JSON object."""
+    constraints = {key: source[key] for key in ('k', 'price_min', 'price_max')
+                   if source.get(key) not in (None, '')}
+    if str(source.get('cheaper', '')).lower() in ('1', 'true'):
+        constraints['cheaper'] = True
+    brands = source.getlist('brands') if hasattr(source, 'getlist') else source.get('brands')
+    if brands:
+        constraints['brands'] = brands  # checked per query, see _similar_options
+    return constraints
+
+
+@bp.route('/similar', methods=['GET', 'POST'])
+def similar():
+    try:
+        if request.method == 'GET':
+            if not request.args.get('name'):
+                raise ValueError('name is required')
+            query = dict(_similar_constraints(request.args), name=request.args['name'])
+            if request.args.get('brand'):
+                query['brand'] = request.args['brand']
+            queries = [query]
+        else:
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict) or not isinstance(body.get('queries'), list):
+                raise ValueError('expected {"queries": [...]}')
+            if not body['queries']:
+                raise ValueError('queries must not be empty')
+            if len(body['queries']) > SIMILAR_BATCH_MAX:
+                raise ValueError('at most %d queries per request' % SIMILAR_BATCH_MAX)
+            # Constraints at the top level apply to every query unless it overrides them.
+            defaults = _similar_constraints(body)
+            queries = [dict(defaults, **q) if isinstance(q, dict) else q for q in body['queries']]
+            if not all(isinstance(q, dict) for q in queries):
+                raise ValueError('each query must be an object')
+        results = similar_phones(queries)
+    except LookupError as e:
+        return jsonify({'error': str(e.args[0])}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if request.method == 'GET':
+        return jsonify({'query': queries[0], 'phones': results[0]})
+    return jsonify({'results': [{'query': q, 'phones': r} for q, r in zip(queries, results)]})
+
+
+# --- Incremental ingestion ------------------------------------------------------
+# New or corrected phones are appended, one JSON batch per line, to INGEST_LOG
+# (via POST /ingest or `flask --app main ingest FILE`). Every worker tails the
+# log before each request (one stat() when nothing changed) and applies unseen
+# batches in order: preprocess just the batch, upsert by (brand, phone_name),
+# add/subtract the affected chart cells, and move to a new dataset version so
+# memoized payloads and cached responses rebuild. No restart, no rescan.
+INGEST_LOG = os.environ.get('INGEST_LOG', 'ingested.jsonl')
+# POST /ingest is disabled unless a token is configured.
+INGEST_TOKEN = os.environ.get('INGEST_TOKEN')
+RAW_COLUMNS = ['phone_name', 'brand', 'os', 'inches', 'resolution', 'battery',
+               'battery_type', 'ram(GB)', 'announcement_date', 'weight(g)',
+               'storage(GB)'] + VIDEO_COLS + ['price(USD)']
+_IDENTITY = ['brand', 'phone_name']
+
+_ingest_lock = threading.Lock()
+_ingest_offset = 0  # bytes of INGEST_LOG already applied in this process
+
+
+def _prepare_batch(records):
+    """Validate and preprocess raw records; returns (raw identity keys, frame)."""
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError('expected a list of phone records')
+    raw = pd.DataFrame.from_records(records)
+    missing = [c for c in RAW_COLUMNS if c not in raw.columns]
+    if missing:
+        raise ValueError('records missing fields: %s' % ', '.join(missing))
+    raw = raw[RAW_COLUMNS]
+    if raw.isna().any().any():
+        raise ValueError('records have empty fields')
+    try:
+        frame = preprocess_data(raw)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError('could not preprocess records: %s' % e)
+    # Within a batch the last record for a phone wins.
+    frame = frame.drop_duplicates(_IDENTITY, keep='last').reset_index(drop=True)
+    return pd.MultiIndex.from_frame(raw[_IDENTITY].astype(str)), frame
+
+
+def _apply_batch(records, line):
+    """Upsert one batch and publish the result as the next dataset version."""
+    global _dataset
+    keys, incoming = _prepare_batch(records)
+    ds = _dataset
+    df = ds.frame
+
+    # Any phone named in the batch is replaced, even if its new record is
+    # dropped as an outlier.
+    replaced = pd.MultiIndex.from_frame(df[_IDENTITY].astype(str)).isin(keys)
+    removed, kept = df[replaced], df[~replaced]
+    for col in PREPROCESS_PARAMS['category_cols']:
+        levels = kept[col].cat.categories.union(incoming[col].cat.categories)
+        kept = kept.assign(**{col: kept[col].cat.set_categories(levels)})
+        incoming = incoming.assign(**{col: incoming[col].cat.set_categories(levels)})
+    merged = pd.concat([kept, incoming], ignore_index=True)
+    merged = merged.assign(**{col: merged[col].cat.remove_unused_categories()
+                              for col in PREPROCESS_PARAMS['category_cols']})
+
+    cells = (ds.cells.sub(_cell_measures(removed), fill_value=0)
+             .add(_cell_measures(incoming), fill_value=0))
+    cells = cells[cells['count'] > 0]
+
+    version = hashlib.sha256((ds.version + line).encode()).hexdigest()[:16]
+    _dataset = Dataset(version, merged, cells)
+    _invalidate_caches()
+    if _insights_current is not None:
+        _schedule_training()  # retrain in the background; the old payload serves meanwhile
+    return {'received': len(records), 'upserted': len(incoming),
+            'replaced': int(replaced.sum())}
+
+
+def _invalidate_caches():
+    """Drop memoized builds of earlier versions.
+
+    Only frees memory: entries are keyed by their Dataset, so a build that
+    finishes after this (and caches the version it started from) is never
+    served for the new version, just dropped by the next ingest.
+    """
+    for cached in (_charts_payload, _sliced_charts, _sort_order, _position_index,
+                   _search_text, _similarity_index):
+        cached.cache_clear()
+
+
+def _sync_ingest_log():
+    """Apply batches appended to INGEST_LOG since this process last looked."""
+    global _ingest_offset
+    try:
+        size = os.path.getsize(INGEST_LOG)
+    except OSError:
+        return
+    if size <= _ingest_offset:
+        return
+    with _ingest_lock:
+        with open(INGEST_LOG, 'rb') as f:
+            f.seek(_ingest_offset)
+            chunk = f.read(size - _ingest_offset)
+        # Only whole lines: a writer may be mid-append.
+        complete = chunk[:chunk.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            text = line.decode('utf-8')
+            try:
+                _apply_batch(json.loads(text), text)
+            except ValueError as e:
+                # Batches are validated before they are logged; skip anything
+                # that still fails rather than wedging every worker.
+                log.error('skipping bad ingest batch: %s', e)
+        _ingest_offset += len(complete)
+
+
+def ingest(records):
+    """Validate a batch, append it to INGEST_LOG and apply it in this process."""
+    _prepare_batch(records)  # reject bad input before it reaches the log
+    line = json.dumps(records, separators=(',', ':'), default=str) + '\n'
+    with open(INGEST_LOG, 'a', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(line)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    _sync_ingest_log()
+    ds = _dataset
+    return {'received': len(records), 'rows': len(ds.frame), 'dataset_version': ds.version}
+
+
+# Endpoints that answer without the dataset; everything else loads it first.
+_DATALESS_ENDPOINTS = {'dashboard.healthz', 'dashboard.metrics', 'dashboard.slow_requests',
+                       'static'}
+
+
+@bp.before_app_request
+def _sync_before_request():
+    if request.endpoint in _DATALESS_ENDPOINTS:
+        return
+    load()
+    _sync_ingest_log()
+    g.dataset = _dataset  # this request's snapshot, see current()
+
+
+@bp.route('/ingest', methods=['POST'])
+def ingest_data():
+    if not INGEST_TOKEN:
+        return jsonify({'error': 'ingestion is disabled (set INGEST_TOKEN)'}), 403
+    given = request.headers.get('Authorization', '').encode('utf-8')
+    if not hmac.compare_digest(given, ('Bearer ' + INGEST_TOKEN).encode('utf-8')):
+        return jsonify({'error': 'invalid token'}), 401
+    body = request.get_json(silent=True)
+    records = body.get('records') if isinstance(body, dict) else body
+    try:
+        return jsonify(ingest(records))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@bp.cli.command('ingest')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def ingest_command(path):
+    """Append or update phones from a CSV or JSON file (CSV column schema)."""
+    load()
+    if path.endswith('.json'):
+        with open(path) as f:
+            records = json.load(f)
+    else:
+        records = pd.read_csv(path).to_dict(orient='records')
+    result = ingest(records)
+    print('ingested %(received)d records; %(rows)d phones; dataset version %(dataset_version)s'
+          % result)
+
+
+# Routes whose responses warm() builds ahead of the first visitor.
+WARM_URLS = ['/', '/browse.html', '/browse-full.html', '/data/charts.json',
+             '/data/charts.json?format=columnar', '/data/insights.json']
+# ...and every section, as the dashboard requests it.
+WARM_URLS += ['/data/charts/%s.json?format=columnar' % name
+              for name in list(CHART_SECTIONS) + list(INSIGHT_SECTIONS)]
+
+
+def warm():
+    """Build every cached payload and response body in this process.
+
+    Loads the dataset, trains (or loads) the insights artifact and renders each
+    WARM_URLS response through the normal route code. Run from the gunicorn
+    master in preload mode (gunicorn.conf.py), everything built here is
+    inherited by the workers.
+    """
+    load()
+    with _startup_phase('insights'):
+        _insights_payload()
+    client = app.test_client()
+    with _startup_phase('responses'):
+        for url in WARM_URLS:
+            client.get(url)
+
+
+def warm_in_background():
+    """Start warm() on a daemon thread and return it.
+
+    The fast-boot hook: the process serves straight away (/healthz at once,
+    data routes as soon as load() is done) while caches fill behind it.
+    """
+    thread = threading.Thread(target=warm, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def _print_startup_report():
+    report = startup_report()
+    for phase, seconds in report['phases'].items():
+        print('%-14s %9.1f ms' % (phase, seconds * 1000))
+    print('%-14s %9.1f ms' % ('uptime', report['uptime_seconds'] * 1000))
+
+
+# Warm-up: `flask --app main warm` trains once and writes the artifact, so every
+# worker started afterwards loads it in milliseconds instead of retraining.
+@bp.cli.command('warm')
+def warm_command():
+    """Precompute cached artifacts for the current dataset version."""
+    warm()
+    _print_startup_report()
+    print('insights artifact ready: %s' % _artifact_path('insights.json'))
+
+
+def create_app():
+    """A new app serving the dashboard.
+
+    Cheap: it registers the routes and nothing else. The dataset loads on the
+    first request that needs it, or ahead of time via warm() or
+    warm_in_background().
+    """
+    new_app = Flask(__name__)
+    new_app.register_blueprint(bp)
+    return new_app
+
 
+app = create_app()
+_startup['import'] = round(time.perf_counter() - _import_started, 4)
 
 if __name__ == '__main__':
     app.run(port=int(os.environ.get('PORT', '5000')))
@@ -0,0 +1,342 @@
+"""The modeling subsystem: insights training, the value index and the similarity tree.
+
+This is the only module that imports scikit-learn. main.py imports it on
+first use (a training run, /predict, /data/value or /similar), so a process
+that only serves health checks, pages and charts never pays for sklearn. It
+holds no dataset state of its own: callers pass in the frame and parameters.
+"""
+import collections
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# --- Training engine --------------------------------------------------------------
+# The held-out fit, each cross-validation fold and k-means are independent, so
+# they run concurrently under an explicit budget: no more jobs than usable
+# cores, nor than TRAIN_MEMORY_MB allows at an estimated cost per job. The
+# default threading backend shares the read-only feature arrays between jobs
+# outright (sklearn's tree building releases the GIL); TRAIN_BACKEND=loky uses
+# processes instead, with large arrays memory-mapped rather than copied. Each
+# job fits with n_jobs=1 and native thread pools are capped at cores/jobs, so
+# nothing fans out behind the budget's back — the original OOM came from
+# n_jobs=-1 forking one data copy per detected CPU on 512 MB instances.
+TRAIN_JOBS = int(os.environ.get('TRAIN_JOBS', '0'))  # 0 = as many as the budget allows
+TRAIN_MEMORY_MB = int(os.environ.get('TRAIN_MEMORY_MB', '192'))
+TRAIN_BACKEND = os.environ.get('TRAIN_BACKEND', 'threading')
+# Rough fixed cost of one extra loky worker process (interpreter + sklearn imports).
+_PROCESS_JOB_MB = 150
+
+
+def _usable_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        return os.cpu_count() or 1
+
+
+def _training_budget(n_rows, estimators):
+    """Return (jobs, backend, native threads per job) for training on `n_rows` rows."""
+    # A fully grown forest holds ~2 nodes per training row per tree at ~100 bytes
+    # each (node struct + value); that dominates a job's working set.
+    job_mb = 2 * n_rows * estimators * 100 / 2**20
+    if TRAIN_BACKEND != 'threading':
+        job_mb += _PROCESS_JOB_MB
+    cores = _usable_cores()
+    jobs = max(1, min(cores, int(TRAIN_MEMORY_MB // max(job_mb, 1))))
+    if TRAIN_JOBS:
+        jobs = min(jobs, TRAIN_JOBS)
+    return jobs, TRAIN_BACKEND, max(1, cores // jobs)
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def _run_stages(stages, n_rows, estimators):
+    """Run (name, fn, args) stages under the training budget.
+
+    Returns ({name: result}, meta) where meta records the budget and the
+    wall-clock seconds of every stage.
+    """
+    from joblib import Parallel, delayed
+    from threadpoolctl import threadpool_limits
+
+    jobs, backend, threads = _training_budget(n_rows, estimators)
+    started = time.perf_counter()
+    with threadpool_limits(limits=threads):
+        out = Parallel(n_jobs=jobs, backend=backend, max_nbytes='1M', mmap_mode='r')(
+            delayed(_timed)(fn, *args) for _, fn, args in stages)
+    timings = {name: round(seconds, 3) for (name, _, _), (_, seconds) in zip(stages, out)}
+    timings['total'] = round(time.perf_counter() - started, 3)
+    results = {name: result for (name, _, _), (result, _) in zip(stages, out)}
+    return results, {'jobs': jobs, 'backend': backend, 'timings': timings}
+
+
+def _forest(p):
+    from sklearn.ensemble import RandomForestRegressor
+    # n_jobs=1: parallelism comes from running stages side by side (above).
+    return RandomForestRegressor(n_estimators=p['rf_estimators'],
+                                 random_state=p['random_state'], n_jobs=1)
+
+
+def _stage_holdout(X, y, p):
+    """Fit linear + random forest on a train split; predictions on the test split."""
+    from sklearn.model_selection import train_test_split
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.pipeline import make_pipeline
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=p['test_size'], random_state=p['random_state'])
+    linear = make_pipeline(StandardScaler(), LinearRegression()).fit(X_train, y_train)
+    rf = _forest(p).fit(X_train, y_train)
+    return {'y_test': y_test, 'lin_pred': linear.predict(X_test),
+            'rf_pred': rf.predict(X_test), 'importances': rf.feature_importances_,
+            'model': rf}
+
+
+def _stage_fold(X, y, train_idx, test_idx, p):
+    """One cross_val_predict fold: fit on train_idx, predict test_idx."""
+    return _forest(p).fit(X[train_idx], y[train_idx]).predict(X[test_idx])
+
+
+def _stage_kmeans(values, p):
+    """Raw k-means labels on standardized `values`."""
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.cluster import KMeans
+
+    scaled = StandardScaler().fit_transform(values)
+    return KMeans(n_clusters=p['kmeans_clusters'], random_state=p['random_state'],
+                  n_init=p['kmeans_n_init']).fit_predict(scaled)
+
+
+def train_insights(df, p):
+    """Train every insights model on `df` with model parameters `p`.
+
+    Returns (payload, resident artifacts by name).
+    """
+    from sklearn.model_selection import KFold
+    from sklearn.metrics import r2_score, mean_absolute_error
+
+    feature_cols = p['feature_cols']
+    model_rows = df.dropna(subset=feature_cols + ['price(USD)'])
+    model_df = model_rows.reset_index(drop=True)
+    # Models see float64 regardless of df's compact storage dtypes
+    X = model_df[feature_cols].to_numpy(dtype='float64')
+    y = model_df['price(USD)'].to_numpy(dtype='float64')
+
+    cluster_cols = p['cluster_cols']
+    cluster_rows = df.dropna(subset=cluster_cols)
+    cluster_df = cluster_rows.reset_index(drop=True)
+
+    # Same folds cross_val_predict(cv=n) uses for a regressor: unshuffled KFold.
+    folds = list(KFold(n_splits=p['cv_folds']).split(X))
+    stages = [('holdout', _stage_holdout, (X, y, p))]
+    stages += [('cv_fold_%d' % i, _stage_fold, (X, y, train, test, p))
+               for i, (train, test) in enumerate(folds)]
+    stages += [('kmeans', _stage_kmeans, (cluster_df[cluster_cols].to_numpy(dtype='float64'), p))]
+    results, meta = _run_stages(stages, len(X), p['rf_estimators'])
+
+    # --- 1. Price-driver model: compare linear vs random forest, report importance ---
+    holdout = results['holdout']
+    y_test, lin_pred, rf_pred = holdout['y_test'], holdout['lin_pred'], holdout['rf_pred']
+
+    metrics = {
+        'linear': {'r2': round(float(r2_score(y_test, lin_pred)), 3),
+                   'mae': round(float(mean_absolute_error(y_test, lin_pred)), 1)},
+        'random_forest': {'r2': round(float(r2_score(y_test, rf_pred)), 3),
+                          'mae': round(float(mean_absolute_error(y_test, rf_pred)), 1)},
+    }
+
+    importance = sorted(
+        ({'feature': f, 'importance': round(float(i), 4)}
+         for f, i in zip(feature_cols, holdout['importances'])),
+        key=lambda d: d['importance'], reverse=True)
+
+    pred_vs_actual = {
+        'actual': [round(float(v), 2) for v in y_test],
+        'predicted': [round(float(v), 2) for v in rf_pred],
+    }
+
+    # --- 2. Best-value ranking: out-of-fold residual (predicted - actual). A phone
+    #        priced below what its specs predict is good value (positive residual). ---
+    oof_pred = np.empty(len(y))
+    for i, (_, test) in enumerate(folds):
+        oof_pred[test] = results['cv_fold_%d' % i]
+
+    # --- 3. Market tiers via k-means, ordered by mean price -> budget/mid/flagship ---
+    raw_labels = results['kmeans']
+
+    # Map raw cluster ids -> tier rank (0=cheapest) by ascending mean price
+    order = (cluster_df.assign(c=raw_labels)
+             .groupby('c')['price(USD)'].mean().sort_values().index.tolist())
+    rank_of = {c: i for i, c in enumerate(order)}
+    tier_idx = [rank_of[c] for c in raw_labels]
+    tier_names = TIER_NAMES
+
+    summary = []
+    for i, c in enumerate(order):
+        grp = cluster_df[raw_labels == c]
+        summary.append({
+            'tier': tier_names[i],
+            'count': int(len(grp)),
+            'mean_price': round(float(grp['price(USD)'].mean()), 0),
+            'mean_ram': round(float(grp['ram(GB)'].mean()), 1),
+            'mean_battery': round(float(grp['battery'].mean()), 0),
+            'mean_storage': round(float(grp['storage(GB)'].mean()), 0),
+        })
+
+    tiers = {
+        'names': tier_names,
+        'summary': summary,
+        'points': {
+            'storage': [round(float(v), 0) for v in cluster_df['storage(GB)']],
+            'price': [round(float(v), 2) for v in cluster_df['price(USD)']],
+            'tier': tier_idx,
+        },
+    }
+
+    # Every modelled phone's residual, indexed for /data/value; the payload's
+    # value_ranking is just its two ends.
+    phone_tier = (pd.Series(tier_idx, index=cluster_rows.index)
+                  .reindex(model_rows.index, fill_value=-1).to_numpy())
+    value_index = build_value_index(
+        model_df['phone_name'].to_numpy(dtype=str), model_df['brand'].to_numpy(dtype=str),
+        model_df['announcement_year'].to_numpy(dtype='int64'), phone_tier, y, oof_pred)
+    n = len(value_index['residual'])
+    value_ranking = {
+        'best': value_rows(value_index, np.arange(min(15, n))),
+        'worst': value_rows(value_index, np.arange(n - 1, max(n - 15, 0) - 1, -1)),
+    }
+
+    return {
+        'price_model': {'metrics': metrics, 'importance': importance,
+                        'pred_vs_actual': pred_vs_actual},
+        'value_ranking': value_ranking,
+        'tiers': tiers,
+        'meta': {'training': meta},
+    }, {'price_model.joblib': holdout['model'], 'value_index.npz': value_index}
+
+
+def dump_artifact(name, obj, f):
+    """Write one of train_insights()'s by-products (keyed by file name) to `f`."""
+    if name.endswith('.npz'):
+        np.savez(f, **obj)
+    else:
+        import joblib
+        joblib.dump(obj, f)
+
+
+def load_artifact(name, path):
+    """Read back a by-product written by dump_artifact()."""
+    if name.endswith('.npz'):
+        with np.load(path, allow_pickle=False) as data:
+            return {key: data[key] for key in data.files}
+    import joblib
+    return joblib.load(path)
+
+
+# --- Value index ------------------------------------------------------------------
+# Out-of-fold residuals (predicted - actual price) for the whole catalog, stored
+# as parallel arrays sorted best value first, plus per-brand/year/tier
+# partitions in CSR form (positions grouped by key; `<dim>_starts[i]` is where
+# key i's run begins). Because every partition lists positions in ascending
+# order, it is itself sorted by value: top-k for any filter is a slice, with
+# the price band applied as a mask over just that partition.
+TIER_NAMES = ['Budget', 'Mid-range', 'Flagship']
+VALUE_DIMS = ('brand', 'year', 'tier')
+
+
+def build_value_index(names, brands, years, tiers, actual, predicted):
+    residual = predicted - actual
+    order = np.argsort(-residual, kind='stable')  # best value first
+    index = {'name': names[order], 'brand': brands[order], 'year': years[order],
+             'tier': np.asarray(tiers, dtype='int8')[order], 'actual': actual[order],
+             'predicted': predicted[order], 'residual': residual[order]}
+    for dim in VALUE_DIMS:
+        perm = np.argsort(index[dim], kind='stable')
+        keys, starts = np.unique(index[dim][perm], return_index=True)
+        index[dim + '_perm'], index[dim + '_keys'], index[dim + '_starts'] = perm, keys, starts
+    return index
+
+
+def _partition(index, dim, key):
+    """Positions (best value first) of phones whose `dim` equals `key`."""
+    keys, starts, perm = index[dim + '_keys'], index[dim + '_starts'], index[dim + '_perm']
+    i = int(np.searchsorted(keys, key))
+    if i == len(keys) or keys[i] != key:
+        return perm[:0]
+    end = starts[i + 1] if i + 1 < len(starts) else len(perm)
+    return perm[starts[i]:end]
+
+
+def query_value_index(index, order='best', k=15, brands=(), years=(), tiers=(),
+                      price_min=None, price_max=None):
+    """Return (matches, positions of the top-k best or worst value phones)."""
+    n = len(index['residual'])
+    candidates = None
+    for dim, wanted in zip(VALUE_DIMS, (brands, years, tiers)):
+        if wanted:
+            # unique, not just sorted: a repeated value would add its partition twice
+            pos = np.unique(np.concatenate([_partition(index, dim, w) for w in wanted]))
+            candidates = pos if candidates is None else np.intersect1d(
+                candidates, pos, assume_unique=True)
+    if price_min is not None or price_max is not None:
+        if candidates is None:
+            candidates = np.arange(n)
+        actual = index['actual'][candidates]
+        keep = np.ones(len(candidates), dtype=bool)
+        if price_min is not None:
+            keep &= actual >= price_min
+        if price_max is not None:
+            keep &= actual <= price_max
+        candidates = candidates[keep]
+    if candidates is None:  # unfiltered: the index order itself
+        top = np.arange(min(k, n)) if order == 'best' else np.arange(n - 1, max(n - k, 0) - 1, -1)
+        return n, top
+    return len(candidates), candidates[:k] if order == 'best' else candidates[::-1][:k]
+
+
+def value_rows(index, positions, detail=False):
+    rows = []
+    for i in positions:
+        row = {
+            'name': str(index['name'][i]),
+            'brand': str(index['brand'][i]),
+            'actual': round(float(index['actual'][i]), 0),
+            'predicted': round(float(index['predicted'][i]), 0),
+            'residual': round(float(index['residual'][i]), 0),
+        }
+        if detail:
+            tier = int(index['tier'][i])
+            row['year'] = int(index['year'][i])
+            row['tier'] = TIER_NAMES[tier] if tier >= 0 else None
+        rows.append(row)
+    return rows
+
+
+# --- Similarity tree --------------------------------------------------------------
+def build_similarity_index(df, feature_cols):
+    """A KD-tree over the standardized `feature_cols` of every row that has them all.
+
+    Returns the tree plus what a query needs alongside it: the standardized
+    points, their df positions (`rows`), the scaling, price, brand and the tree
+    positions of each phone name.
+    """
+    from sklearn.neighbors import KDTree
+    values = df[feature_cols].to_numpy(dtype='float64')
+    rows = np.flatnonzero(~np.isnan(values).any(axis=1))  # df positions in the tree
+    values = values[rows]
+    mean, std = values.mean(axis=0), values.std(axis=0)
+    std[std == 0] = 1
+    by_name = collections.defaultdict(list)
+    for i, name in enumerate(df['phone_name'].to_numpy(dtype=str)[rows]):
+        by_name[name].append(i)
+    points = (values - mean) / std
+    return {'tree': KDTree(points), 'points': points, 'rows': rows, 'mean': mean, 'std': std,
+            'price': df['price(USD)'].to_numpy(dtype='float64')[rows],
+            'brand': df['brand'].to_numpy(dtype=str)[rows], 'by_name': by_name}
@@ -6,13 +6,20 @@
  * renders collapsed, so we lazily draw each chart the first time its container
  * becomes visible, and call Plotly.Plots.resize() on later reveals.
  *
- * Adding a chart: register a builder in CHARTS keyed by its div id and add a
- * matching <div id="..."> in index.html.
+ * Data is fetched the same way, per chart: /data/charts/manifest.json lists the
+ * sections of the charts and insights payloads, and a chart's sections are
+ * fetched (once) when it first needs to render, so the landing tab paints
+ * without waiting for histogram arrays or model outputs it does not show.
+ *
+ * Adding a chart: register a builder in CHARTS keyed by its div id, the
+ * sections it reads in CHART_SECTIONS, and add a matching <div id="..."> in
+ * index.html.
  */
 (function () {
   'use strict';
 
-  let chartData = null;
+  // The payload sections fetched so far, merged (see mergeSection).
+  const chartData = {};
   const renderedIds = new Set();
 
   // --- Warm Editorial theme (mirrors design/tokens.css) -----------------------
@@ -249,8 +256,25 @@
     },
 
     'chart-price-by-os': function (d) {
-      const traces = Object.keys(d.price_by_os).map(function (os) {
-        return { type: 'box', name: os, y: d.price_by_os[os], boxpoints: false };
+      const traces = [];
+      Object.keys(d.price_by_os).forEach(function (os) {
+        const box = d.price_by_os[os];
+        if (!box.q1) {  // raw prices: Plotly computes the box
+          traces.push({ type: 'box', name: os, y: box, boxpoints: false });
+          return;
+        }
+        // Summary mode (summary=1): precomputed quartiles, plus capped outliers.
+        traces.push({
+          type: 'box', name: os, x: [os], q1: [box.q1], median: [box.median], q3: [box.q3],
+          lowerfence: [box.lowerfence], upperfence: [box.upperfence], mean: [box.mean],
+        });
+        if (box.outliers.length) {
+          traces.push({
+            type: 'scatter', mode: 'markers', name: os, hoverinfo: 'y',
+            x: Array(box.outliers.length).fill(os), y: box.outliers,
+            marker: { size: 4, color: ACCENT },
+          });
+        }
       });
       return {
         data: traces,
@@ -266,9 +290,23 @@
     'chart-histograms': function (d) {
       const cols = Object.keys(d.histograms);
       const traces = cols.map(function (col, i) {
+        const hist = d.histograms[col];
+        if (!hist.edges) {  // raw values: Plotly bins them
+          return {
+            type: 'histogram', name: COLUMN_LABELS[col] || col,
+            x: hist, marker: { color: ACCENT },
+            visible: i === 0,
+          };
+        }
+        // Summary mode (summary=1): server-side bin edges and counts.
+        const centers = [], widths = [];
+        for (let b = 0; b < hist.counts.length; b++) {
+          centers.push((hist.edges[b] + hist.edges[b + 1]) / 2);
+          widths.push(hist.edges[b + 1] - hist.edges[b]);
+        }
         return {
-          type: 'histogram', name: COLUMN_LABELS[col] || col,
-          x: d.histograms[col], marker: { color: ACCENT },
+          type: 'bar', name: COLUMN_LABELS[col] || col,
+          x: centers, y: hist.counts, width: widths, marker: { color: ACCENT },
           visible: i === 0,
         };
       });
@@ -420,13 +458,121 @@
     },
   };
 
+  // Sections (of /data/charts/manifest.json) each chart's builder reads.
+  const CHART_SECTIONS = {
+    'chart-brand-pie': ['brand_counts'],
+    'chart-os-pie': ['os_counts'],
+    'chart-battery-type-pie': ['battery_type_counts'],
+    'chart-avg-price-by-brand': ['avg_price_by_brand'],
+    'chart-battery-efficiency': ['battery_efficiency_by_brand'],
+    'chart-video-formats': ['video_formats'],
+    'chart-specs-by-brand': ['specs_by_brand'],
+    'chart-correlation': ['correlation'],
+    'chart-yearly-trends': ['yearly_trends'],
+    'chart-price-by-os': ['price_by_os'],
+    'chart-histograms': ['histograms'],
+    'chart-price-drivers': ['price_model'],
+    'chart-pred-actual': ['pred_vs_actual'],
+    'chart-value-ranking': ['value_ranking'],
+    'chart-tiers-scatter': ['tiers'],
+    'chart-tiers-summary': ['tiers'],
+  };
+  // The hero KPI strip is always visible; it needs these up front.
+  const KPI_SECTIONS = ['brand_counts', 'price_model', 'value_ranking'];
+
+  // --- Section loading ----------------------------------------------------------
+  let manifest = null;
+  const requestedSections = new Set();
+  const loadedSections = new Set();
+
+  // Page filters (e.g. /?brand=Apple&year_min=2020) slice the descriptive charts;
+  // /?summary=1 asks for pre-binned histograms and box statistics instead.
+  const chartQuery = new URLSearchParams();
+  new URLSearchParams(window.location.search).forEach(function (value, key) {
+    if (['brand', 'os', 'battery_type', 'year_min', 'year_max', 'summary', 'bins']
+        .indexOf(key) >= 0) {
+      chartQuery.append(key, value);
+    }
+  });
+  chartQuery.set('format', 'columnar');
+
+  function getJSON(url) {
+    return fetch(url).then(function (r) {
+      if (!r.ok) throw new Error(url + ' HTTP ' + r.status);
+      return r.json();
+    });
+  }
+
+  // Model sections answer 503 + Retry-After while training; wait and ask again.
+  function getSection(url) {
+    return fetch(url).then(function (r) {
+      if (r.status === 503) {
+        const seconds = parseFloat(r.headers.get('Retry-After')) || 5;
+        return new Promise(function (resolve) { setTimeout(resolve, seconds * 1000); })
+          .then(function () { return getSection(url); });
+      }
+      if (!r.ok) throw new Error(url + ' HTTP ' + r.status);
+      return r.json();
+    });
+  }
+
+  // format=columnar ships raw numeric arrays as base64 little-endian float32
+  // buffers; decode each into a Float32Array (Plotly accepts typed arrays, and
+  // every browser we target is little-endian).
+  function decodeColumns(group) {
+    Object.keys(group || {}).forEach(function (k) {
+      const col = group[k];
+      if (!col || col.encoding !== 'base64') return;
+      const bin = atob(col.data);
+      const bytes = new Uint8Array(bin.length);
+      for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+      group[k] = new Float32Array(bytes.buffer);
+    });
+  }
+
+  // A section is a fragment of the combined payload, e.g. {"tiers": {...}};
+  // two sections may fill in different keys of one object (price_model and
+  // pred_vs_actual), so objects merge one level deep.
+  function isPlainObject(v) {
+    return v !== null && typeof v === 'object' && !Array.isArray(v) && !ArrayBuffer.isView(v);
+  }
+  function mergeSection(fragment) {
+    Object.keys(fragment).forEach(function (key) {
+      const value = fragment[key];
+      const current = chartData[key];
+      chartData[key] = isPlainObject(current) && isPlainObject(value)
+        ? Object.assign({}, current, value) : value;
+    });
+  }
+
+  // Fetch any of `names` not requested yet; each re-renders when it arrives.
+  function requestSections(names) {
+    if (!manifest) return;
+    names.forEach(function (name) {
+      const info = manifest.sections[name];
+      if (!info || requestedSections.has(name)) return;
+      requestedSections.add(name);
+      const url = info.source === 'charts' ? info.url + '?' + chartQuery.toString() : info.url;
+      getSection(url)
+        .then(function (fragment) {
+          decodeColumns(fragment.histograms);
+          decodeColumns(fragment.price_by_os);
+          mergeSection(fragment);
+          loadedSections.add(name);
+          populateKPIs(chartData);
+          renderVisibleCharts();
+        })
+        .catch(function (err) { console.error('Failed to load section ' + name + ':', err); });
+    });
+  }
+  // ----------------------------------------------------------------------------
+
   function isVisible(el) {
     // offsetParent is null for display:none ancestors; width guards collapsed details.
     return el.offsetParent !== null && el.clientWidth > 0;
   }
 
   function renderVisibleCharts() {
-    if (!chartData) return;
     Object.keys(CHARTS).forEach(function (id) {
       const el = document.getElementById(id);
       if (!el || !isVisible(el)) return;
@@ -434,9 +580,14 @@
         Plotly.Plots.resize(el);
         return;
       }
-      // A builder may throw if its data hasn't arrived yet (charts.json and
-      // insights.json load independently). Skip without marking rendered so the
-      // chart is retried on the next merge/visibility pass.
+      // First showing: fetch the chart's sections; it renders once they arrive.
+      const needs = CHART_SECTIONS[id] || [];
+      if (!needs.every(function (name) { return loadedSections.has(name); })) {
+        requestSections(needs);
+        return;
+      }
+      // A builder may still throw on unexpected data. Skip without marking
+      // rendered so the chart is retried on the next merge/visibility pass.
       let fig;
       try {
         fig = CHARTS[id](chartData);
@@ -448,9 +599,9 @@
     });
   }
 
-  // Fill the hero KPI strip from whichever payload has arrived. Each stat is
-  // guarded so it populates as soon as its source data is present (charts.json
-  // carries the count; insights.json carries the model-derived stats).
+  // Fill the hero KPI strip from whichever sections have arrived. Each stat is
+  // guarded so it populates as soon as its source data is present (brand_counts
+  // carries the count; the model sections carry the rest).
   function setText(id, value) {
     const el = document.getElementById(id);
     if (el && value != null) el.textContent = value;
@@ -461,7 +612,7 @@
         function (a, k) { return a + d.brand_counts[k]; }, 0);
       setText('kpi-count', total.toLocaleString());
     }
-    if (d.price_model) {
+    if (d.price_model && d.price_model.importance) {
       const top = d.price_model.importance[0];
       setText('kpi-driver', DRIVER_LABELS[top.feature] || top.feature);
       setText('kpi-r2', 'R² ' + d.price_model.metrics.random_forest.r2);
@@ -486,26 +637,12 @@
       det.addEventListener('toggle', schedule);
     });
 
-    function getJSON(url) {
-      return fetch(url).then(function (r) {
-        if (!r.ok) throw new Error(url + ' HTTP ' + r.status);
-        return r.json();
-      });
-    }
-
-    // Descriptive charts (charts.json) and modeling insights (insights.json) load
-    // independently: the modeling endpoint is heavier, so we don't let it block or
-    // sink the descriptive charts. Each merges what it has and re-renders.
-    function merge(data) {
-      chartData = Object.assign({}, chartData, data);
-      populateKPIs(chartData);
-      renderVisibleCharts();
-    }
-    getJSON('/data/charts.json')
-      .then(merge)
-      .catch(function (err) { console.error('Failed to load charts.json:', err); });
-    getJSON('/data/insights.json')
-      .then(merge)
-      .catch(function (err) { console.error('Failed to load insights.json:', err); });
+    getJSON('/data/charts/manifest.json')
+      .then(function (m) {
+        manifest = m;
+        requestSections(KPI_SECTIONS);
+        renderVisibleCharts();
+      })
+      .catch(function (err) { console.error('Failed to load the chart manifest:', err); });
   });
 })();
@@ -6,10 +6,18 @@ outputs are deterministic because main.py fixes random_state=42 everywhere.
 
 Run from the repo root:  python -m pytest
 """
+import os
+
 import main
 import pytest
 
 
+@pytest.fixture(scope="module", autouse=True)
+def dataset():
+    # Importing main loads nothing; these tests read main.current() directly.
+    main.load()
+
+
 @pytest.fixture(scope="module")
 def client():
     main.app.config["TESTING"] = True
@@ -20,6 +28,21 @@ def test_home_ok(client):
     assert client.get("/").status_code == 200
 
 
+def test_pages_cached_with_etag_and_gzip(client):
+    import gzip
+    first = client.get("/browse.html")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag
+    # Repeat loads revalidate and get a bodiless 304.
+    again = client.get("/browse.html", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+    # Precompressed variant decodes to the same page under its own strong ETag.
+    gz = client.get("/browse.html", headers={"Accept-Encoding": "gzip"})
+    assert gz.headers["Content-Encoding"] == "gzip"
+    assert gz.headers["ETag"] != etag
+    assert gzip.decompress(gz.data) == first.data
+
+
 def test_browse_json_is_list(client):
     r = client.get("/browse.json")
     assert r.status_code == 200
@@ -27,6 +50,55 @@ def test_browse_json_is_list(client):
     assert isinstance(data, list) and len(data) > 0
 
 
+def test_browse_json_streams_in_chunks(client, monkeypatch):
+    import json
+    whole = client.get("/browse.json").get_json()
+    monkeypatch.setattr(main, "BROWSE_STREAM_ROWS", 7)
+    r = client.get("/browse.json")
+    assert r.is_streamed and r.get_json() == whole
+    nd = client.get("/browse.json", headers={"Accept": "application/x-ndjson"})
+    assert nd.mimetype == "application/x-ndjson"
+    assert [json.loads(line) for line in nd.data.splitlines()] == whole
+
+
+def test_browse_json_paged_sorted_filtered(client):
+    d = client.get("/browse.json?offset=5&limit=10&sort=-price(USD)").get_json()
+    assert d["total"] == d["filtered"] == len(main.current().frame)
+    prices = [r["price(USD)"] for r in d["rows"]]
+    assert len(prices) == 10 and prices == sorted(prices, reverse=True)
+    assert prices[0] == sorted(main.current().frame["price(USD)"], reverse=True)[5]
+
+    d = client.get("/browse.json?brand=Samsung&price_max=300&sort=price(USD)&limit=1000").get_json()
+    df = main.current().frame
+    expected = df[(df["brand"] == "Samsung") & (df["price(USD)"] <= 300)]
+    assert d["filtered"] == len(expected) == len(d["rows"])
+    assert all(r["brand"] == "Samsung" and r["price(USD)"] <= 300 for r in d["rows"])
+
+    assert client.get("/browse.json?sort=nope").status_code == 400
+
+
+def test_browse_json_datatables_protocol(client):
+    r = client.get("/browse.json", query_string={
+        "draw": "3", "start": "0", "length": "10", "search[value]": "galaxy",
+        "columns[0][data]": "phone_name", "columns[1][data]": "price(USD)",
+        "order[0][column]": "1", "order[0][dir]": "asc"})
+    d = r.get_json()
+    assert d["draw"] == 3 and d["recordsTotal"] == len(main.current().frame)
+    assert 0 < d["recordsFiltered"] < len(main.current().frame)
+    assert all(set(row) == {"phone_name", "price(USD)"} for row in d["data"])
+    assert all("galaxy" in row["phone_name"].lower() for row in d["data"])
+    prices = [row["price(USD)"] for row in d["data"]]
+    assert prices == sorted(prices)
+
+
+def test_browse_pages_switch_to_server_side(client, monkeypatch):
+    monkeypatch.setattr(main, "BROWSE_SERVER_SIDE_ROWS", 10)
+    monkeypatch.setattr(main, "_response_cache", {})  # pages are cached per dataset version
+    html = client.get("/browse.html").get_data(as_text=True)
+    assert 'data-server-side="true"' in html and "<td>" not in html
+    assert "<th>video_4K</th>" in client.get("/browse-full.html").get_data(as_text=True)
+
+
 # --- /data/charts.json (descriptive payload) ---
 
 def test_charts_json_contract(client):
@@ -60,8 +132,33 @@ def insights(client):
 
 
 def test_insights_top_level_keys(insights):
-    for key in ("price_model", "value_ranking", "tiers"):
+    for key in ("price_model", "value_ranking", "tiers", "meta"):
         assert key in insights
+    assert insights["meta"]["model_version"] and insights["meta"]["rows"] > 0
+
+
+def test_training_reports_stage_timings(insights):
+    training = insights["meta"]["training"]
+    assert training["jobs"] >= 1
+    stages = set(training["timings"])
+    assert {"holdout", "kmeans", "total"} <= stages
+    assert sum(s.startswith("cv_fold_") for s in stages) == main.MODEL_PARAMS["cv_folds"]
+
+
+def test_training_budget_caps_jobs(monkeypatch):
+    import modeling
+    monkeypatch.setattr(modeling, "_usable_cores", lambda: 16)
+    monkeypatch.setattr(modeling, "TRAIN_MEMORY_MB", 192)
+    jobs, backend, threads = modeling._training_budget(1500, 100)
+    assert 1 < jobs < 16 and threads == 16 // jobs
+    # A small host never gets more jobs than it has memory for, and processes cost more.
+    monkeypatch.setattr(modeling, "TRAIN_MEMORY_MB", 64)
+    assert modeling._training_budget(1500, 100)[0] < jobs
+    monkeypatch.setattr(modeling, "TRAIN_BACKEND", "loky")
+    assert modeling._training_budget(1500, 100)[0] == 1
+    monkeypatch.setattr(modeling, "TRAIN_MEMORY_MB", 100_000)
+    monkeypatch.setattr(modeling, "TRAIN_JOBS", 3)
+    assert modeling._training_budget(1500, 100)[0] == 3
 
 
 def test_price_model_metrics_sane(insights):
@@ -85,6 +182,37 @@ def test_value_ranking_ordered(insights):
     assert best[0]["residual"] > 0
 
 
+def test_value_index_queries(client, insights):
+    top = client.get("/data/value?k=15").get_json()
+    assert top["model_version"] == insights["meta"]["model_version"]
+    strip = lambda rows: [{k: r[k] for k in ("name", "brand", "actual", "predicted", "residual")}
+                          for r in rows]
+    assert strip(top["phones"]) == insights["value_ranking"]["best"]
+    worst = client.get("/data/value?order=worst&k=15").get_json()
+    assert strip(worst["phones"]) == insights["value_ranking"]["worst"]
+    assert top["matches"] == worst["matches"] > 15
+    # Filters compose; results stay best-first within the filtered set.
+    got = client.get("/data/value?brand=Samsung&brand=Apple&tier=Flagship"
+                     "&price_max=900&k=500").get_json()
+    assert got["matches"] == len(got["phones"]) > 0
+    assert all(p["brand"] in ("Samsung", "Apple") and p["tier"] == "Flagship"
+               and p["actual"] <= 900 for p in got["phones"])
+    residuals = [p["residual"] for p in got["phones"]]
+    assert residuals == sorted(residuals, reverse=True)
+    year = got["phones"][0]["year"]
+    by_year = client.get(f"/data/value?year={year}&k=500").get_json()["phones"]
+    assert by_year and all(p["year"] == year for p in by_year)
+    # Repeated filter values match once.
+    once = client.get("/data/value?brand=Apple&tier=Flagship&k=500").get_json()
+    twice = client.get("/data/value?brand=Apple&brand=Apple&tier=Flagship&tier=Flagship"
+                       "&k=500").get_json()
+    assert twice["matches"] == once["matches"] == len(twice["phones"]) > 0
+    assert twice["phones"] == once["phones"]
+    assert client.get("/data/value?brand=Nobody").get_json()["matches"] == 0
+    assert client.get("/data/value?tier=Premium").status_code == 400
+    assert client.get("/data/value?order=middle").status_code == 400
+
+
 def test_tiers_price_ordered(insights):
     summary = insights["tiers"]["summary"]
     assert [t["tier"] for t in summary] == ["Budget", "Mid-range", "Flagship"]
@@ -93,3 +221,490 @@ def test_tiers_price_ordered(insights):
     # Scatter point arrays are aligned and cover the dataset.
     pts = insights["tiers"]["points"]
     assert len(pts["storage"]) == len(pts["price"]) == len(pts["tier"])
+
+
+# --- /predict (resident price model) ---
+
+def test_predict_single_and_batch(client, insights):
+    cols = main.MODEL_PARAMS["feature_cols"] + ["price(USD)"]
+    phones = main.current().frame[cols].head(50).astype(float).to_dict(orient="records")
+    one = client.post("/predict", json=phones[0]).get_json()
+    assert one["model_version"] == insights["meta"]["model_version"]
+    assert len(one["predictions"]) == 1
+    batch = client.post("/predict", json={"specs": phones}).get_json()
+    preds = batch["predictions"]
+    assert len(preds) == 50 and preds[0] == one["predictions"][0]
+    # Residual follows value_ranking's sign: predicted - actual.
+    assert all(abs(p["residual"] - (p["predicted"] - s["price(USD)"])) < 0.02
+               for p, s in zip(preds, phones))
+    del phones[0]["price(USD)"]
+    assert client.post("/predict", json=phones[0]).get_json()["predictions"][0]["residual"] is None
+    stats = client.get("/predict").get_json()
+    assert stats["requests"] >= 3 and stats["p50_ms"] <= stats["p99_ms"]
+
+
+def test_predict_rejects_bad_specs(client):
+    assert client.post("/predict", json={"inches": 6.1}).status_code == 400
+    assert client.post("/predict", json=[]).status_code == 400
+    spec = dict.fromkeys(main.MODEL_PARAMS["feature_cols"], "big")
+    assert client.post("/predict", json=spec).status_code == 400
+
+
+# --- /similar (nearest-neighbour index) ---
+
+def test_similar_nearest_with_constraints(client):
+    import numpy as np
+    got = client.get("/similar?name=Galaxy S23&brand=Samsung&k=5").get_json()["phones"]
+    assert len(got) == 5 and "Galaxy S23" not in [p["phone_name"] for p in got]
+    distances = [p["distance"] for p in got]
+    assert distances == sorted(distances)
+    # Same answer as brute force over the standardized specs.
+    cols = main.MODEL_PARAMS["feature_cols"]
+    df = main.current().frame
+    specs = df[cols].dropna()
+    z = (specs - specs.mean()) / specs.std(ddof=0)
+    me = z[(df["phone_name"] == "Galaxy S23") & (df["brand"] == "Samsung")].to_numpy()[0]
+    brute = np.sort(np.linalg.norm(z.to_numpy() - me, axis=1))[1:6]
+    assert np.allclose(distances, brute, atol=1e-3)
+
+    price = float(df.loc[df["phone_name"] == "Galaxy S23", "price(USD)"].iloc[0])
+    cheaper = client.get("/similar?name=Galaxy S23&k=8&cheaper=1&brands=Xiaomi").get_json()["phones"]
+    assert len(cheaper) == 8
+    assert all(p["brand"] == "Xiaomi" and p["price(USD)"] < price for p in cheaper)
+
+
+def test_similar_batch_and_errors(client):
+    spec = main.current().frame[main.MODEL_PARAMS["feature_cols"]].iloc[0].astype(float).to_dict()
+    body = {"queries": [{"name": "Galaxy S23", "brand": "Samsung"}, dict(spec, k=3)],
+            "k": 4, "price_max": 300}
+    results = client.post("/similar", json=body).get_json()["results"]
+    assert [len(r["phones"]) for r in results] == [4, 3]
+    assert all(p["price(USD)"] <= 300 for r in results for p in r["phones"])
+    one = client.get("/similar?name=Galaxy S23&brand=Samsung&k=4&price_max=300").get_json()
+    assert results[0]["phones"] == one["phones"]
+    assert client.get("/similar?name=No Such Phone").status_code == 404
+    assert client.get("/similar").status_code == 400
+    assert client.post("/similar", json={"queries": [{"inches": 6}]}).status_code == 400
+    assert client.post("/similar", json={"queries": [dict(spec, cheaper=True)]}).status_code == 400
+    # Wrong value types are a 400 with a JSON error, never a 500.
+    for bad in ({"queries": [{"name": "Galaxy S23", "k": None}]},
+                {"queries": [{"name": "Galaxy S23"}], "brands": 5},
+                {"queries": [{"name": "Galaxy S23", "price_max": [1]}]},
+                {"queries": []}):
+        r = client.post("/similar", json=bad)
+        assert r.status_code == 400 and r.is_json, bad
+    assert client.get("/similar?name=Galaxy S23&k=abc").get_json() == {"error": "k must be an integer"}
+
+
+# --- Instrumentation ---
+
+def test_metrics_and_server_timing(client, monkeypatch):
+    monkeypatch.setattr(main, "_response_cache", {})
+    first = client.get("/browse.html")
+    stages = [part.split(";")[0] for part in first.headers["Server-Timing"].split(", ")]
+    assert {"render-browse", "compress", "total"} <= set(stages)
+    assert client.get("/browse.html").headers["Server-Timing"].startswith("total;dur=")
+    text = client.get("/metrics").data.decode()
+    assert 'phone_dashboard_cache_requests_total{cache="response:browse",result="hit"}' in text
+    assert 'phone_dashboard_http_request_duration_seconds_bucket{method="GET",' \
+           'route="/browse.html",status="200",le="+Inf"}' in text
+    assert 'phone_dashboard_stage_duration_seconds_count{stage="render-browse"}' in text
+    assert "# TYPE phone_dashboard_http_response_bytes histogram" in text
+
+
+def test_slow_request_profiler(client, monkeypatch):
+    monkeypatch.setattr(main, "PROFILE_SLOW_MS", 0.001)
+    monkeypatch.setattr(main, "_slow_requests", main.collections.deque(maxlen=20))
+    client.get("/browse.json?limit=5")
+    monkeypatch.setattr(main, "PROFILE_SLOW_MS", 0)
+    slow = client.get("/debug/slow.json").get_json()["requests"]
+    assert [r["path"] for r in slow] == ["/browse.json?limit=5"]
+    assert all(s["stack"] for s in slow[0]["stacks"]) and not main._profiled
+
+
+# --- Preprocessing + dataset snapshot ---
+
+def test_preprocess_is_vectorized_pipeline():
+    import pandas as pd
+    raw = pd.read_csv(main.DATA_CSV)
+    before = raw.copy()
+    frame = main.preprocess_data(raw)
+    pd.testing.assert_frame_equal(raw, before)  # input untouched
+    assert frame["weight(g)"].max() <= 450 and frame["price(USD)"].max() <= 1500
+    gt5 = frame[(frame["brand"] == "Realme") & (frame["phone_name"] == "GT5 240W")]
+    assert gt5["storage(GB)"].tolist() == [1024]
+    for col in ("brand", "os", "battery_type"):
+        assert frame[col].dtype == "category"
+    assert {"width", "height", "announcement_year"} <= set(frame.columns)
+    assert not {"resolution", "announcement_date"} & set(frame.columns)
+
+
+def test_chunked_read_matches_one_shot():
+    import pandas as pd
+    whole = main.preprocess_data(pd.read_csv(main.DATA_CSV))
+    chunked, cells = main.read_preprocessed(main.DATA_CSV, chunksize=97)
+    pd.testing.assert_frame_equal(chunked, whole, check_exact=True)
+    pd.testing.assert_frame_equal(cells, main._cell_measures(whole))
+    pd.testing.assert_frame_equal(main._accumulate_cells(whole, chunksize=113),
+                                  main._cell_measures(whole))
+
+
+def test_compact_model_roundtrips_public_schema(client):
+    import pandas as pd
+    raw = pd.read_csv(main.DATA_CSV)
+    df = main.current().frame
+    assert "video_flags" in df.columns and not set(main.VIDEO_COLS) & set(df.columns)
+    assert df["ram(GB)"].dtype.itemsize < 8 and df["announcement_year"].dtype.itemsize < 4
+    # Packed flags decode back to exactly the CSV's booleans.
+    packed = main.compact_frame(raw.copy())
+    pd.testing.assert_frame_equal(main.with_video_columns(packed)[main.VIDEO_COLS],
+                                  raw[main.VIDEO_COLS])
+    assert list(main.with_video_columns(df).columns) == main.public_columns()
+    # The home page's info panel shows the public dtypes, not the compact ones.
+    dtypes = {str(t) for t in main.public_dtypes(df).dtypes}
+    assert dtypes == {"str", "float64", "int64", "int32", "bool"}, dtypes
+    row = client.get("/browse.json").get_json()[0]
+    assert isinstance(row["video_4K"], bool) and "video_flags" not in row
+    report = client.get("/debug/memory.json").get_json()
+    assert report["rows"] == len(df) and report["total_bytes"] > 0
+
+
+def test_dataset_snapshot_roundtrip(tmp_path):
+    import pandas as pd
+    path = str(tmp_path / "dataset")
+    main._save_snapshot(main.current().frame, path)
+    loaded = main._load_snapshot(path)
+    pd.testing.assert_frame_equal(loaded, main.current().frame)
+    # Numeric columns stay file-mapped so workers share one physical copy.
+    assert main._is_mapped(loaded["price(USD)"].to_numpy())
+
+
+def test_fast_boot_defers_data_and_sklearn():
+    # A fresh interpreter: importing main and answering /healthz loads no data
+    # and no pandas; charts load the data but still no sklearn.
+    import subprocess
+    import sys
+    script = """
+import sys, main
+client = main.app.test_client()
+health = client.get("/healthz").get_json()
+assert health["status"] == "ok" and not health["ready"] and main._dataset is None, health
+assert "pandas.core" not in sys.modules and "import" in health["phases"]
+assert client.get("/data/charts.json").status_code == 200 and main._dataset is not None
+assert "sklearn" not in sys.modules
+health = client.get("/healthz").get_json()
+assert health["ready"] and {"dataset", "chart-cells"} <= set(health["phases"]), health
+"""
+    subprocess.run([sys.executable, "-c", script], check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_warm_prebuilds_every_cached_response(monkeypatch):
+    monkeypatch.setattr(main, "_response_cache", {})
+    main.warm()
+    sections = {"charts-columnar:" + s for s in main.RAW_SECTIONS}
+    sections |= {"charts:" + s for s in main.CHART_SECTIONS if s not in main.RAW_SECTIONS}
+    sections |= {"insights:" + s for s in main.INSIGHT_SECTIONS}
+    assert {name for name, _ in main._response_cache} == {
+        "home", "browse", "browse-full", "charts", "charts-columnar", "insights"} | sections
+
+
+# --- Insights artifact cache ---
+
+def test_insights_artifact_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ARTIFACT_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "_resident", {})
+    calls = []
+    monkeypatch.setattr(main, "_train_insights", lambda frame: (calls.append(1) or {"trained": True}, {}))
+    payload = main._load_or_train("v1", main.current().frame)
+    assert payload["trained"] and payload["meta"]["model_version"] == "v1"
+    assert (tmp_path / "v1" / "insights.json").exists()
+    # A second cold process (simulated) loads the artifact instead of retraining.
+    assert main._load_or_train("v1", main.current().frame) == payload
+    assert calls == [1]
+
+
+def test_insights_retrain_hot_swaps_without_blocking(tmp_path, monkeypatch):
+    import threading
+    monkeypatch.setattr(main, "ARTIFACT_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "_resident", {})
+    release = threading.Event()
+
+    def slow_train(frame):
+        release.wait(5)
+        return {"trained": "new"}, {}
+
+    monkeypatch.setattr(main, "_train_insights", slow_train)
+    monkeypatch.setattr(main, "_insights_current", {"version": "old", "payload": {"trained": "old"}})
+    monkeypatch.setattr(main, "_dataset", main.current()._replace(version="new-version"))
+    # Data changed: the request gets the previous payload immediately...
+    assert main._insights_payload() == {"trained": "old"}
+    future = main._schedule_training()
+    assert main._schedule_training() is future  # ...and concurrent callers share one run
+    release.set()
+    assert future.result(timeout=5)["meta"]["model_version"] == "new-version"
+    assert main._insights_payload()["trained"] == "new"
+
+
+def test_failed_training_is_logged_and_not_retried(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(main, "ARTIFACT_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "_resident", {})
+    calls = []
+
+    def broken_train(frame):
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(main, "_train_insights", broken_train)
+    monkeypatch.setattr(main, "_train_failed", None)
+    monkeypatch.setattr(main, "_counters", main.collections.defaultdict(float))
+    monkeypatch.setattr(main, "_insights_current", {"version": "old", "payload": {"trained": "old"}})
+    monkeypatch.setattr(main, "_dataset", main.current()._replace(version="broken-version"))
+    assert main._insights_payload() == {"trained": "old"}
+    with pytest.raises(RuntimeError):
+        main._schedule_training().result(timeout=5)
+    assert "broken-version" in caplog.text
+    assert "training_failures_total 1" in main.metrics_text()
+    # Later requests keep the old payload without starting another run.
+    assert main._insights_payload() == {"trained": "old"}
+    with pytest.raises(RuntimeError):
+        main._schedule_training().result(timeout=5)
+    assert calls == [1]
+
+
+def test_concurrent_cold_requests_build_once(monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(main, "_response_cache", {})
+    started, release, calls = threading.Event(), threading.Event(), []
+
+    def slow_render():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "<html>built once</html>"
+
+    def get(_):
+        with main.app.test_request_context("/"):
+            return main._cached_response("slow", slow_render).get_data()
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(get, i) for i in range(4)]
+        started.wait(5)
+        release.set()
+        bodies = [f.result(timeout=5) for f in futures]
+    assert calls == [1] and set(bodies) == {b"<html>built once</html>"}
+    assert not main._inflight
+
+
+def test_cold_insights_request_gets_503_instead_of_blocking(client, tmp_path, monkeypatch):
+    import threading
+    monkeypatch.setattr(main, "ARTIFACT_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "INSIGHTS_WAIT_SECONDS", 0.05)
+    monkeypatch.setattr(main, "_insights_current", None)
+    monkeypatch.setattr(main, "_dataset", main.current()._replace(version="cold-version"))
+    release = threading.Event()
+
+    def slow_train(frame):
+        release.wait(5)
+        return {"trained": "cold"}, {}
+
+    monkeypatch.setattr(main, "_train_insights", slow_train)
+    r = client.get("/data/insights.json")
+    assert r.status_code == 503 and r.headers["Retry-After"]
+    release.set()
+    # Training carried on in the background; outside a request we just wait.
+    assert main._insights_payload()["trained"] == "cold"
+
+
+def test_artifact_training_is_locked_across_workers(tmp_path, monkeypatch):
+    import threading
+    import time
+    monkeypatch.setattr(main, "ARTIFACT_DIR", str(tmp_path))
+    calls = []
+
+    def train(frame):
+        calls.append(1)
+        time.sleep(0.2)  # long enough for the other threads to miss the artifact too
+        return {"trained": True}, {}
+
+    monkeypatch.setattr(main, "_train_insights", train)
+    # Each thread opens its own lock file description, as separate processes would.
+    threads = [threading.Thread(target=main._load_or_train, args=("v2", main.current().frame))
+               for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert calls == [1]
+
+
+def test_dataset_key_tracks_model_params(monkeypatch):
+    key = main._dataset_key()
+    assert key == main.current().version
+    monkeypatch.setitem(main.MODEL_PARAMS, "rf_estimators", 7)
+    assert main._dataset_key() != key
+
+
+def test_charts_json_filters_roll_up_from_cube(client):
+    main._sliced_charts.cache_clear()
+    url = "/data/charts.json?brand=Samsung&brand=Apple&year_min=2020"
+    got = client.get(url).get_json()
+    df = main.current().frame
+    sub = df[df["brand"].isin(["Samsung", "Apple"]) & (df["announcement_year"] >= 2020)]
+    assert got["filters"] == {"brand": ["Apple", "Samsung"], "announcement_year": [2020, None]}
+    assert got["brand_counts"] == {b: int(n) for b, n in sub["brand"].value_counts().items() if n}
+    avg = sub.groupby("brand", observed=True)["price(USD)"].mean()
+    assert dict(zip(got["avg_price_by_brand"]["brands"], got["avg_price_by_brand"]["values"])) == \
+        {b: round(float(v), 2) for b, v in avg.items()}
+    assert len(got["histograms"]["price(USD)"]) == sub["price(USD)"].notna().sum()
+    # Hot combinations are answered from the LRU, with the usual ETag/304.
+    again = client.get("/data/charts.json?year_min=2020&brand=Apple&brand=Samsung")
+    assert main._sliced_charts.cache_info().hits == 1
+    assert client.get(url, headers={"If-None-Match": again.headers["ETag"]}).status_code == 304
+    # A one-year slice has a constant year column: its correlations are null, not NaN.
+    one_year = client.get("/data/charts.json?year_min=2021&year_max=2021").get_json()
+    assert one_year["correlation"]["matrix"][-1] == [None] * len(main.NUMERIC_COLS)
+    assert client.get("/data/charts.json?brand=Nobody").get_json()["brand_counts"] == {}
+    assert client.get("/data/charts.json?year_min=soon").status_code == 400
+
+
+def test_charts_json_summary_mode(client):
+    import numpy as np
+    raw = client.get("/data/charts.json").get_json()
+    got = client.get("/data/charts.json?summary=1&bins=12")
+    summary = got.get_json()
+    assert len(got.data) < len(client.get("/data/charts.json").data) / 5
+    # Everything but the raw arrays is unchanged.
+    assert {k: v for k, v in summary.items() if k not in ("histograms", "price_by_os")} == \
+        {k: v for k, v in raw.items() if k not in ("histograms", "price_by_os")}
+    for col, values in raw["histograms"].items():
+        hist = summary["histograms"][col]
+        assert len(hist["edges"]) == 13 and sum(hist["counts"]) == len(values)
+    for os_name, prices in raw["price_by_os"].items():
+        box = summary["price_by_os"][os_name]
+        q1, median, q3 = np.percentile(prices, [25, 50, 75])
+        assert (box["q1"], box["median"], box["q3"]) == (round(q1, 2), round(median, 2), round(q3, 2))
+        assert box["n"] == len(prices) and len(box["outliers"]) <= main.BOX_OUTLIER_CAP
+        assert all(v < box["lowerfence"] or v > box["upperfence"] for v in box["outliers"])
+    # Summaries compose with filters and ignore the columnar encoding.
+    sliced = client.get("/data/charts.json?summary=1&brand=Samsung&format=columnar")
+    assert sliced.mimetype == "application/json"
+    assert sum(sliced.get_json()["histograms"]["price(USD)"]["counts"]) == \
+        int((main.current().frame["brand"] == "Samsung").sum())
+
+
+def test_chart_sections_match_full_payloads(client, insights):
+    manifest = client.get("/data/charts/manifest.json").get_json()
+    assert manifest["dataset_version"] == main.current().version
+    assert set(manifest["sections"]) == set(main.CHART_SECTIONS) | set(main.INSIGHT_SECTIONS)
+    full = client.get("/data/charts.json").get_json()
+    merged = {}
+    for name, info in manifest["sections"].items():
+        r = client.get(info["url"])
+        assert r.status_code == 200 and r.headers["ETag"], name
+        for key, value in r.get_json().items():
+            merged[key] = {**merged[key], **value} if key in merged else value
+    # The sections are a partition of the two payloads, each served on its own.
+    assert merged == {**full, **{k: v for k, v in insights.items() if k != "meta"}}
+    assert list(client.get("/data/charts/brand_counts.json").get_json()) == ["brand_counts"]
+    sliced = client.get("/data/charts/os_counts.json?brand=Apple").get_json()
+    assert sliced["os_counts"] == client.get("/data/charts.json?brand=Apple").get_json()["os_counts"]
+    assert client.get("/data/charts/nope.json").status_code == 404
+
+
+def test_charts_json_columnar_matches_json(client):
+    import base64
+    import numpy as np
+    plain = client.get("/data/charts.json").get_json()
+    r = client.get("/data/charts.json?format=columnar")
+    assert r.mimetype == main.COLUMNAR_MIMETYPE
+    col = r.get_json()
+    assert col["brand_counts"] == plain["brand_counts"]
+    for group in ("histograms", "price_by_os"):
+        assert set(col[group]) == set(plain[group])
+        for key, enc in col[group].items():
+            values = np.frombuffer(base64.b64decode(enc["data"]), dtype="<f4")
+            assert enc["length"] == len(values) == len(plain[group][key])
+            np.testing.assert_allclose(values, plain[group][key], rtol=1e-6, atol=5e-3)  # JSON rounds prices to cents
+    # Also negotiable via Accept, and unknown formats are rejected.
+    negotiated = client.get("/data/charts.json", headers={"Accept": main.COLUMNAR_MIMETYPE})
+    assert negotiated.mimetype == main.COLUMNAR_MIMETYPE
+    assert client.get("/data/charts.json?format=xml").status_code == 400
+
+
+# --- Incremental ingestion ---
+
+@pytest.fixture
+def ingest_sandbox(tmp_path, monkeypatch):
+    """Route ingestion to a temp log and restore the live dataset afterwards."""
+    for name in ("_dataset", "_ingest_offset"):
+        monkeypatch.setattr(main, name, getattr(main, name))
+    monkeypatch.setattr(main, "INGEST_LOG", str(tmp_path / "ingested.jsonl"))
+    monkeypatch.setattr(main, "INGEST_TOKEN", "secret")
+    monkeypatch.setattr(main, "_insights_current", None)  # no background retrain here
+    yield
+    monkeypatch.undo()
+    main._invalidate_caches()
+
+
+def _phone(**overrides):
+    record = {"phone_name": "Test One", "brand": "Nothing", "os": "Android 13",
+              "inches": 6.55, "resolution": "1080x2400", "battery": 4500,
+              "battery_type": "Li-Po", "ram(GB)": 8, "announcement_date": "2023-07-11",
+              "weight(g)": 201.0, "storage(GB)": 256, "price(USD)": 499.0}
+    record.update({col: col in ("video_1080p", "video_4K", "video_30fps") for col in main.VIDEO_COLS})
+    record.update(overrides)
+    return record
+
+
+def test_ingest_updates_aggregates_incrementally(client, ingest_sandbox):
+    rows = len(main.current().frame)
+    before = client.get("/data/charts.json").get_json()
+    existing = main.current().frame.iloc[0]
+    r = client.post("/ingest", headers={"Authorization": "Bearer secret"}, json=[
+        _phone(),
+        # Re-price an existing phone: an upsert, not a second row.
+        _phone(phone_name=existing["phone_name"], brand=str(existing["brand"]), **{"price(USD)": 1234.0}),
+    ])
+    assert r.status_code == 200 and r.get_json()["rows"] == rows + 1
+    after = client.get("/data/charts.json").get_json()
+    assert after["brand_counts"]["Nothing"] == 1
+    assert after["video_formats"]["video_4K"]["true"] >= before["video_formats"]["video_4K"]["true"]
+    # The incrementally maintained cells equal a from-scratch rebuild.
+    fresh = main._cell_measures(main.current().frame)
+    cells = main.current().cells.reindex(fresh.index)
+    assert ((cells - fresh).abs() <= 1e-6 * fresh.abs().clip(lower=1)).all().all()
+
+
+def test_build_racing_an_ingest_is_not_served_for_the_new_version(client, ingest_sandbox, monkeypatch):
+    import threading
+    monkeypatch.setattr(main, "_response_cache", {})
+    main._charts_payload.cache_clear()
+    started, release = threading.Event(), threading.Event()
+    build = main._build_charts
+
+    def slow_build(*args, **kwargs):
+        if not started.is_set():
+            started.set()
+            release.wait(5)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(main, "_build_charts", slow_build)
+    racer = threading.Thread(target=lambda: main.app.test_client().get("/data/charts.json"))
+    racer.start()
+    assert started.wait(5)
+    r = client.post("/ingest", headers={"Authorization": "Bearer secret"}, json=[_phone()])
+    assert r.status_code == 200
+    release.set()  # the old-version build finishes after the swap
+    racer.join()
+    assert client.get("/data/charts.json").get_json()["brand_counts"]["Nothing"] == 1
+
+
+def test_ingest_rejects_bad_batches(client, ingest_sandbox):
+    auth = {"Authorization": "Bearer secret"}
+    assert client.post("/ingest", json=[_phone()]).status_code == 401
+    bad = _phone()
+    del bad["resolution"]
+    assert client.post("/ingest", headers=auth, json=[bad]).status_code == 400
+    assert not os.path.exists(main.INGEST_LOG)  # nothing invalid reaches the log